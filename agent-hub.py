@@ -1,14 +1,36 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import json
-import graphviz
+import math
 import base64
+import graphviz
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from flow_graph import (
+    DEFAULT_NODE_BUDGET, SUMMARY_GRAPH_THRESHOLD, GraphCache, build_graph, build_summary_graph, graph_size, render_graph,
+)
+from analytics import agent_summary, error_precursors, rollup_frame, tool_frequency, top_names
+import perf
+from file_store import FileLogStore
+from layout_cache import (
+    LAYOUT_COLLECTION, DiskLayoutCache, MongoLayoutCache, dot_available, is_finished, layout_key, pan_zoom_html,
+    render_layout,
+)
+from live_tail import SessionTail
+from prefetch import Prefetcher
+from message_model import FILTER_ROLES, TOOL_CALL, TOOL_RESPONSE, normalize_messages
+from session_store import MongoLogStore, ensure_indexes, paginate_messages
 
 # Configure the page to use wide layout
 st.set_page_config(layout="wide")
 
+# Timing spans for this rerun; sizes are only measured while the performance panel is shown
+rerun_timings = perf.start_rerun(measure_sizes=st.session_state.get("perf_panel", False))
+
 # Initialize session state variables
 if 'selected_session' not in st.session_state:
     st.session_state.selected_session = None
@@ -20,6 +42,48 @@ if 'filter_roles' not in st.session_state:
 def update_filter_roles():
     st.session_state.filter_roles = st.session_state.role_multiselect
 
+def request_history_jump():
+    st.session_state.history_pending_jump = st.session_state.history_jump
+
+# Messages whose JSON is longer than this show a truncated preview until loaded in full
+HISTORY_PREVIEW_CHARS = 5000
+
+def load_full(key):
+    st.session_state[key] = True
+
+def show_json(body, key, expanded=True):
+    with perf.span("history.json") as json_span:
+        text = body if isinstance(body, str) else json.dumps(body, indent=2, default=str)
+        json_span.fields["chars"] = len(text)
+        if len(text) > HISTORY_PREVIEW_CHARS and not st.session_state.get(key):
+            st.code(text[:HISTORY_PREVIEW_CHARS] + "\n...", language="json")
+            st.button(f"Load full ({len(text) / 1024:.0f} KB)", key=f"{key}_button", on_click=load_full, args=(key,))
+        else:
+            st.json(body, expanded=expanded)
+
+def show_perf_panel():
+    """Sidebar toggle and, when on, the spans of this rerun and the totals since the server started."""
+    st.sidebar.header("Diagnostics")
+    if not st.sidebar.toggle("Performance Panel", key="perf_panel"):
+        return
+    with st.sidebar.expander("Rerun Timings", expanded=True):
+        st.caption(f"This rerun: {rerun_timings.elapsed() * 1000:.0f} ms in {len(rerun_timings.spans)} spans")
+        st.dataframe([span.to_record() for span in rerun_timings.spans], hide_index=True)
+        st.caption("Since server start")
+        st.dataframe(perf.SPAN_STATS.rows(), hide_index=True)
+        st.download_button("Download Rerun (JSON Lines)", file_name="rerun_timings.jsonl", mime="application/json",
+                           data=json.dumps(rerun_timings.to_record(), default=str) + "\n")
+        st.download_button("Download Metrics (Prometheus)", file_name="agent_hub.prom", mime="text/plain",
+                           data=perf.SPAN_STATS.prometheus_text())
+
+def end_rerun():
+    show_perf_panel()
+    perf.finish_rerun(rerun_timings, session=st.session_state.get("selected_session"))
+
+def stop():
+    end_rerun()
+    st.stop()
+
 st.title("snapLogic Agent Flow")
 
 # Load environment variables
@@ -28,308 +92,395 @@ load_dotenv()
 # MongoDB connection string
 MONGO_URI = os.getenv("MONGO_URI")
 
-# Initialize MongoDB client
-client = MongoClient(MONGO_URI)
-db = client.get_database("audiobooks")
-history_collection = db.get_collection("Log")
+# One pooled client per URI, kept across reruns
+@st.cache_resource
+def get_client(uri):
+    return MongoClient(uri, event_listeners=[perf.MongoCommandTimer()])
+
+# Log collection handle per database; indexes are ensured the first time a database is used
+@st.cache_resource
+def get_log_collection(uri, database):
+    collection = get_client(uri).get_database(database).get_collection("Log")
+    ensure_indexes(collection)
+    return collection
+
+# Log store per source: ("mongo", database) or ("file", export file or directory); exports are indexed once
+@st.cache_resource
+def get_log_store(source, location):
+    if source == "file":
+        return FileLogStore(location)
+    return MongoLogStore(get_log_collection(MONGO_URI, location))
 
 # Sidebar for database and session selection
 st.sidebar.header("Database and Session Selection")
 
-# Database selection dropdown
-selected_database = st.sidebar.selectbox("Select Database", ["snaplogic", "audiobooks"], key="selected_database")
+view = st.sidebar.radio("View", ["Session Flow", "Analytics"], horizontal=True, key="view")
 
-# Initialize selected session based on the database
-if "selected_session" not in st.session_state or st.session_state.get("previous_database", None) != selected_database:
+data_source = st.sidebar.radio("Data Source", ["MongoDB", "Export Files"], horizontal=True, key="data_source")
+if data_source == "MongoDB":
+    # Database selection dropdown
+    selected_database = st.sidebar.selectbox("Select Database", ["snaplogic", "audiobooks"], key="selected_database")
+    log_source = ("mongo", selected_database)
+else:
+    export_path = st.sidebar.text_input("Export File or Directory", value=os.getenv("LOG_EXPORT_PATH", ""),
+                                        key="export_path",
+                                        help="Extended JSON or JSONL exports of the Log collection")
+    if not os.path.exists(export_path):
+        st.info("Enter the path of a Log export file or a directory of exports.")
+        stop()
+    log_source = ("file", os.path.abspath(export_path))
+
+# Initialize selected session based on the data source
+if "selected_session" not in st.session_state or st.session_state.get("previous_source", None) != log_source:
     st.session_state.selected_session = None
-st.session_state.previous_database = selected_database
+st.session_state.previous_source = log_source
 
-# MongoDB connection string
-MONGO_URI = os.getenv("MONGO_URI")
-
-# Initialize MongoDB client
-client = MongoClient(MONGO_URI)
-db = client.get_database(selected_database)
-history_collection = db.get_collection("Log")
+log_store = get_log_store(*log_source)
+# Picks up export files that changed on disk; a no-op for MongoDB
+log_store.refresh()
 
-# Fetch distinct agent names
-agent_names = sorted(list(set(history_collection.distinct("agentName"))))
+# Agent names change rarely, so the catalogue is cached for a few minutes
+AGENT_NAMES_TTL = 300
 
-# Fetch session IDs and agent names (up to 10 for initial display)
-all_sessions = list(history_collection.find({}, {"sessionId": 1, "agentName": 1, "_id": 0}).sort("_id", -1).limit(10)) if not agent_names else []
+@st.cache_data(ttl=AGENT_NAMES_TTL)
+def get_agent_names(source):
+    return get_log_store(*source).list_agent_names()
 
+with perf.span("agent_names"):
+    agent_names = get_agent_names(log_source)
 
 # Search boxes for session ID and agent name
 selected_agent = st.sidebar.selectbox("Filter by Agent Name", ["All"] + agent_names)
-search_session_id = st.sidebar.text_input("Search Session ID")
-
-def fetch_history(session_id):
-    if session_id:
-        history = list(history_collection.find({"sessionId": session_id}).limit(1))
-        if history:
-            return history[0].get("messages", [])
-    return []
-
-# Fetch sessions based on search input or get the last 10
-if selected_agent != "All":
-    all_sessions = list(history_collection.find({"agentName": selected_agent}, {"sessionId": 1, "agentName": 1, "_id": 0}).sort("_id", -1).limit(10))
-elif search_session_id:
-    all_sessions = list(history_collection.find({"sessionId": search_session_id}, {"sessionId": 1, "agentName": 1, "_id": 0}))
-else:
-    all_sessions = list(history_collection.find({}, {"sessionId": 1, "agentName": 1, "_id": 0}).sort("_id", -1).limit(10))
+search_session_id = st.sidebar.text_input("Search Session ID (prefix)")
+page_size = st.sidebar.selectbox("Sessions per Page", [10, 25, 50, 100], key="session_page_size")
+
+# Keyset cursor for the session list: None, ("before", _id) or ("after", _id)
+browser_key = (log_source, selected_agent, search_session_id, page_size)
+if st.session_state.get("session_browser_key") != browser_key:
+    st.session_state.session_cursor = None
+st.session_state.session_browser_key = browser_key
+
+def set_session_cursor(cursor):
+    st.session_state.session_cursor = cursor
+
+cursor = st.session_state.session_cursor
+with perf.span("list_sessions"):
+    session_page = log_store.list_sessions(
+        agent_name=selected_agent if selected_agent != "All" else None,
+        session_prefix=search_session_id.strip(),
+        page_size=page_size,
+        before_id=cursor[1] if cursor and cursor[0] == "before" else None,
+        after_id=cursor[1] if cursor and cursor[0] == "after" else None,
+    )
+all_sessions = session_page.sessions
+
+# Error counts for the listed sessions are computed in MongoDB, without fetching any messages
+ERROR_COUNTS_TTL = 60
+
+@st.cache_data(ttl=ERROR_COUNTS_TTL)
+def get_error_counts(source, session_ids):
+    return get_log_store(*source).count_session_errors(session_ids)
 
 # Display session IDs and agent names
 if all_sessions:
+    with perf.span("error_counts"):
+        error_counts = get_error_counts(log_source, tuple(s.get("sessionId") for s in all_sessions))
     for i, session_data in enumerate(all_sessions):
         session_id = session_data.get("sessionId")
         agent_name = session_data.get("agentName")
         session_label = f"{session_id} ({agent_name})" if agent_name else session_id
+        if error_counts.get(session_id):
+            session_label += f" ⚠ {error_counts[session_id]}"
         if st.sidebar.button(session_label, key=f"{session_id}_{i}"):  # Unique key
             st.session_state.selected_session = session_id
 else:
     st.sidebar.info("No sessions found.")
 
+newer_col, older_col = st.sidebar.columns(2)
+newer_col.button("◀ Newer", disabled=not session_page.has_newer,
+                 on_click=set_session_cursor, args=(("after", session_page.first_id),))
+older_col.button("Older ▶", disabled=not session_page.has_older,
+                 on_click=set_session_cursor, args=(("before", session_page.last_id),))
+
+# Full-text search over message text, tool names and arguments, served by the store's search index
+SEARCH_TTL = 60
+
+@st.cache_data(ttl=SEARCH_TTL, show_spinner="Searching messages...")
+def get_search_hits(source, query, agent_name):
+    return get_log_store(*source).search(query, agent_name)
+
+def open_search_hit(session_id, message_ids):
+    st.session_state.selected_session = session_id
+    st.session_state.search_matches = (session_id, message_ids)
+    st.session_state.history_pending_jump = message_ids[0]
+
+def jump_to_search_match():
+    st.session_state.history_pending_jump = st.session_state.search_match
+
+st.sidebar.header("Message Search")
+message_query = st.sidebar.text_input("Search Message Contents", key="message_search",
+                                      help="Words in message text, tool names or tool arguments. "
+                                           "MongoDB sessions are found once index_search.py has indexed them.")
+if message_query.strip():
+    with perf.span("search"):
+        search_hits = get_search_hits(log_source, message_query.strip(),
+                                      selected_agent if selected_agent != "All" else None)
+    if not search_hits:
+        st.sidebar.info("No messages match.")
+    for i, hit in enumerate(search_hits):
+        hit_label = f"{hit.session_id} ({hit.agent_name})" if hit.agent_name else hit.session_id
+        hit_label += f" · {len(hit.message_ids)} matching"
+        st.sidebar.button(hit_label, key=f"search_hit_{i}", on_click=open_search_hit,
+                          args=(hit.session_id, hit.message_ids))
 
-# Graph generation functions
-@st.cache_data
-def generate_graph(history, scale=1.0):
-    # Create graph with improved styling
-    graph = graphviz.Digraph(
-        graph_attr={
-            "rankdir": "TB",
-            "splines": "polyline",
-            "nodesep": f"{0.5 * scale}",
-            "ranksep": f"{0.4 * scale}",
-            "fontname": "Arial",
-            "bgcolor": "white"
-        },
-        node_attr={
-            "fontname": "Arial",
-            "fontsize": "11",
-            "margin": "0.2"
-        }
-    )
-
-    # Track nodes and relationships
-    tool_nodes = {}
-    last_node = None  # Track the last node of any type
-    tool_names = {}
-    next_assistant_id = None
-    current_tool_id = None  # Track the current tool node ID
-
-    # First pass: identify assistant nodes and their IDs
-    assistant_nodes = {}
-    for i, message in enumerate(history):
-        if not isinstance(message, dict):
-            continue
-        msg_id = i + 1
-        if message.get('role', '').lower() == 'assistant':
-            assistant_nodes[msg_id] = f"message_{msg_id}"
-
-    # Get the next assistant ID for a given message ID
-    def get_next_assistant_id(current_id):
-        next_ids = [aid for aid in assistant_nodes.keys() if aid > current_id]
-        return min(next_ids) if next_ids else None
-
-    def is_error_message(message):
-        if message.get('role', '').lower() == 'error' or message.get('sl_role', '').lower() == 'error':
-            return True
-        if isinstance(message.get('content'), list) and len(message['content']) > 0:
-            tool_result = message['content'][0].get('toolResult', {})
-            return bool(tool_result.get('error'))
-        return False
-
-    def get_error_content(message):
-        if message.get('role', '').lower() == 'error' or message.get('sl_role', '').lower() == 'error':
-            return str(message.get('content', 'Unknown error'))
-        if isinstance(message.get('content'), list) and len(message['content']) > 0:
-            tool_result = message['content'][0].get('toolResult', {})
-            return str(tool_result.get('error', 'Unknown error'))
-        return 'Unknown error'
-
-    for i, message in enumerate(history):
-        if not isinstance(message, dict):
-            continue
-        i = i + 1
-        node_id = f"message_{i}"
-        
-        # Determine the role and label
-        role = message.get('sl_role') or message.get('role', 'Output')
-        
-        # Check if this is a tool response message
-        is_tool_response = (
-            role.lower().startswith("tool") or 
-            (role.lower() == "user" and 
-             isinstance(message.get("content"), list) and 
-             len(message.get("content", [])) > 0 and 
-             message["content"][0].get("toolResult") and
-             not message["content"][0].get("toolResult", {}).get('error'))  # Not an error
-        )
-        
-        # Handle error messages
-        if is_error_message(message):
-            error_content = get_error_content(message)
-            error_node_id = node_id
-            graph.node(error_node_id,
-                      label=f"ERROR\nID: {i}\n{error_content[:50]}...",
-                      shape="hexagon",
-                      style="filled",
-                      fillcolor="#FFEBEE",
-                      color="#B71C1C")
-            
-            # Connect error to the last node (whether it's a tool, assistant, or other)
-            if last_node:
-                graph.edge(last_node, error_node_id)
-            
-            # Update last_node to be this error node
-            last_node = error_node_id
-            continue
-
-        # Only create node for system messages and genuine user messages (not tool responses)
-        if role.lower() == "system" or (role.lower() == "user" and not is_tool_response):
-            graph.node(node_id,
-                      label=f"{role.upper()}\nID: {i}",
-                      shape="rectangle",
-                      style="rounded,filled",
-                      fillcolor="#E3F2FD",
-                      color="#1565C0")
-            last_node = node_id
-            
-        if role.lower() == "assistant":
-            next_assistant_id = get_next_assistant_id(i)
-            
-            if message.get("tool_calls") or (isinstance(message.get("content"), list) and len(message["content"]) > 1 and message["content"][1].get("toolUse")):
-                tool_calls_text = [f"Assistant\nID: {i}"]
-                if message.get("tool_calls"):
-                    for tool_call in message["tool_calls"]:
-                        tool_calls_text.append(f"• {tool_call['function']['name']}")
-                        tool_names[tool_call['id']] = tool_call['function']['name']
-                elif isinstance(message.get("content"), list) and len(message["content"]) > 1:
-                    tool_use = message["content"][1].get("toolUse", {})
-                    tool_calls_text.append(f"• {tool_use.get('name', 'Unknown')}")
-                    tool_names[tool_use.get('toolUseId')] = tool_use.get('name', 'Unknown')
-                label = "\n".join(tool_calls_text)
-            else:
-                label = f"Assistant\nID: {i}"
-
-            graph.node(node_id,
-                      label=label,
-                      shape="rectangle",
-                      style="rounded,filled",
-                      fillcolor="#FFF3E0",
-                      color="#E65100")
-            
-            last_node = node_id
-            
-            if message.get("tool_calls") or (isinstance(message.get("content"), list) and len(message["content"]) > 1 and message["content"][1].get("toolUse")):
-                with graph.subgraph() as s:
-                    s.attr(rank='same')
-                    y = 1
-                    if message.get("tool_calls"):
-                        for tool_call in message["tool_calls"]:
-                            tool_node_id = f"tool_{tool_call['id']}"
-                            tool_name = tool_call['function']['name']
-                            s.node(tool_node_id,
-                                  label=f"{tool_name}\nID: {i+y}",
-                                  shape="hexagon",
-                                  style="filled",
-                                  fillcolor="#F3E5F5",
-                                  color="#6A1B9A")
-                            graph.edge(node_id, tool_node_id)
-                            tool_nodes[tool_call['id']] = {
-                                'node_id': tool_node_id,
-                                'next_assistant': next_assistant_id
-                            }
-                            last_node = tool_node_id  # Update last_node to this tool node
-                            y += 1
-                    elif isinstance(message.get("content"), list) and len(message["content"]) > 1:
-                        tool_use = message["content"][1].get("toolUse", {})
-                        tool_node_id = f"tool_{tool_use.get('toolUseId', 'unknown')}"
-                        tool_name = tool_use.get('name', 'Unknown')
-                        s.node(tool_node_id,
-                              label=f"{tool_name}\nID: {i+y}",
-                              shape="hexagon",
-                              style="filled",
-                              fillcolor="#F3E5F5",
-                              color="#6A1B9A")
-                        graph.edge(node_id, tool_node_id)
-                        tool_nodes[tool_use.get('toolUseId', 'unknown')] = {
-                            'node_id': tool_node_id,
-                            'next_assistant': next_assistant_id
-                        }
-                        last_node = tool_node_id  # Update last_node to this tool node
-            
-        elif is_tool_response:
-            if message.get("function_id") and message["function_id"] in tool_nodes:
-                tool_info = tool_nodes[message["function_id"]]
-                last_node = tool_info['node_id']  # Update last_node to this tool node
-                if tool_info['next_assistant']:
-                    next_assistant_node = f"message_{tool_info['next_assistant']}"
-                    graph.edge(tool_info['node_id'], next_assistant_node)
-            elif isinstance(message.get("content"), list) and len(message["content"]) > 0:
-                tool_result = message["content"][0].get("toolResult", {})
-                tool_use_id = tool_result.get("toolUseId", "")
-                if tool_use_id in tool_nodes:
-                    tool_info = tool_nodes[tool_use_id]
-                    last_node = tool_info['node_id']  # Update last_node to this tool node
-                    if tool_info['next_assistant']:
-                        next_assistant_node = f"message_{tool_info['next_assistant']}"
-                        graph.edge(tool_info['node_id'], next_assistant_node)
-
-    return graph, tool_names
-
-def get_max_concurrent_tools(history):
-    max_tools = 0
-    for message in history:
-        if isinstance(message, dict):
-            # Check standard tool calls
-            if message.get("tool_calls"):
-                max_tools = max(max_tools, len(message["tool_calls"]))
-            # Check snaplogic style tool calls
-            elif (isinstance(message.get("content"), list) and 
-                  len(message["content"]) > 1 and 
-                  isinstance(message["content"][1], dict) and
-                  message["content"][1].get("toolUse")):
-                max_tools = max(max_tools, 1)  # Count single tool use
-    return max(max_tools, 3)  # Minimum width of 3 for readability
 
 def get_graph_source(graph):
     """Get the DOT source code for the graph."""
     return graph.source
 
+# Memory budget for built graphs, shared by every user of this server
+GRAPH_CACHE_MB = int(os.getenv("GRAPH_CACHE_MB", "256"))
+
+@st.cache_resource
+def get_graph_cache():
+    return GraphCache(GRAPH_CACHE_MB * 1024 * 1024)
+
+# The full session document is only fetched when its graph is not cached yet
+def get_session_graph(graph_cache, store, source, session):
+    def build():
+        with perf.span("graph.load_session"):
+            full_session = store.load_session(session.session_id)
+        with perf.span("graph.build"):
+            return build_graph(normalize_messages(full_session.messages if full_session else []))
+
+    key = (source, session.session_id, session.fingerprint)
+    return graph_cache.get_or_build(key, build)
+
+def get_session_summary_graph(graph_cache, store, source, session, node_budget, expanded):
+    def build():
+        with perf.span("graph.load_session"):
+            full_session = store.load_session(session.session_id)
+        with perf.span("graph.build_summary"):
+            messages = normalize_messages(full_session.messages if full_session else [])
+            return build_summary_graph(messages, node_budget, expanded)
+
+    key = (source, session.session_id, session.fingerprint, "summary", node_budget, expanded)
+    return graph_cache.get_or_build(key, build, sizer=lambda summary: graph_size(summary.graph))
+
 # Create sidebar controls for graph
 st.sidebar.header("Graph Controls")
 graph_scale = st.sidebar.slider("Graph Scale", min_value=0.5, max_value=2.0, value=1.0, step=0.1)
+graph_mode = st.sidebar.radio("Graph Mode", ["Auto", "Detailed", "Summary"], horizontal=True, key="graph_mode",
+                              help="Summary folds repeated tool calls and collapses older turns to fit the node budget")
+node_budget = st.sidebar.number_input("Node Budget", min_value=20, max_value=2000, value=DEFAULT_NODE_BUDGET,
+                                      step=10, key="graph_node_budget")
+
+# Finished sessions are laid out on the server once and the SVG shared through a layout cache:
+# LAYOUT_CACHE_DIR when set (e.g. a volume shared by all replicas), else LogLayout or a directory next to the exports
+LAYOUT_CACHE_DIR = os.getenv("LAYOUT_CACHE_DIR")
+LAYOUT_VIEWER_HEIGHT = 700
+
+@st.cache_resource
+def get_layout_cache(source, location):
+    if LAYOUT_CACHE_DIR:
+        return DiskLayoutCache(LAYOUT_CACHE_DIR)
+    if source == "file":
+        export_dir = location if os.path.isdir(location) else os.path.dirname(location)
+        return DiskLayoutCache(os.path.join(export_dir, ".agent-hub-layouts"))
+    return MongoLayoutCache(get_log_collection(MONGO_URI, location).database.get_collection(LAYOUT_COLLECTION))
+
+@st.cache_resource
+def server_layout_available():
+    return dot_available()
+
+server_layout = st.sidebar.toggle("Pre-rendered Layout", value=True, key="server_layout",
+                                  disabled=not server_layout_available(),
+                                  help="Lay finished sessions out once on the server and keep the SVG; "
+                                       "drag to pan, scroll to zoom, double click to reset. "
+                                       "Needs the Graphviz dot executable on the server.")
+
+# Live tail controls for in-flight sessions
+st.sidebar.header("Live Tail")
+follow_session = st.sidebar.toggle("Follow Selected Session", key="live_tail",
+                                   disabled=not log_store.supports_live_tail)
+tail_interval = st.sidebar.number_input("Refresh Interval (s)", min_value=1, max_value=60, value=2, key="live_tail_interval")
+
+# Longest wait between polls while a followed session is idle
+LIVE_TAIL_MAX_INTERVAL = 30
+
+def get_session_tail(source, session_id, interval):
+    """Live tail kept in the user's session state, replaced when the session or interval changes."""
+    tail_key = (source, session_id, interval)
+    if st.session_state.get("session_tail_key") == tail_key:
+        return st.session_state.session_tail
+    close_session_tail()
+    tail = SessionTail(get_log_store(*source).collection, session_id,
+                       interval=interval, max_interval=LIVE_TAIL_MAX_INTERVAL)
+    st.session_state.session_tail = tail
+    st.session_state.session_tail_key = tail_key
+    return tail
+
+def close_session_tail():
+    tail = st.session_state.pop("session_tail", None)
+    st.session_state.pop("session_tail_key", None)
+    if tail is not None:
+        tail.close()
+
+# Rollups are filled by rollup_sessions.py (or the file index); the view rereads them at most once per ROLLUP_TTL
+ROLLUP_TTL = 300
+
+@st.cache_data(ttl=ROLLUP_TTL, show_spinner="Loading rollups...")
+def get_rollup_frame(source, agent_name):
+    return rollup_frame(get_log_store(*source).load_rollups(agent_name))
+
+# Cross-session analytics view
+if view == "Analytics":
+    close_session_tail()
+    st.header("Analytics")
+    if st.button("Refresh Rollups"):
+        get_rollup_frame.clear()
+    with perf.span("rollups"):
+        rollups = get_rollup_frame(log_source, selected_agent if selected_agent != "All" else None)
+    if rollups.empty:
+        st.info("No sessions to analyze. MongoDB sessions show up once rollup_sessions.py has rolled them up.")
+        stop()
+
+    sessions_col, messages_col, errors_col, turns_col = st.columns(4)
+    sessions_col.metric("Sessions", f"{len(rollups):,}")
+    messages_col.metric("Messages", f"{rollups['messageCount'].sum():,}")
+    errors_col.metric("Sessions with Errors", f"{(rollups['errors'] > 0).mean():.1%}")
+    turns_col.metric("Median Turns", f"{rollups['turns'].median():g}")
+
+    st.subheader("Per Agent")
+    st.dataframe(agent_summary(rollups), column_config={
+        "sessions_with_errors": st.column_config.NumberColumn("Sessions with Errors", format="percent"),
+        "error_rate": st.column_config.NumberColumn("Error Rate (per message)", format="percent"),
+        "median_turns": st.column_config.NumberColumn("Median Turns"),
+    })
+
+    st.subheader("Tool Calls")
+    st.bar_chart(top_names(tool_frequency(rollups)), horizontal=True)
+
+    st.subheader("Tools Called Before Errors")
+    precursors = top_names(error_precursors(rollups))
+    if precursors.empty:
+        st.info("No errors recorded.")
+    else:
+        st.bar_chart(precursors, horizontal=True)
+    stop()
+
+# While the graph is shown, the listed sessions' graphs are built in the background, so opening one is a cache hit
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+# Document bytes prefetched per session list at most
+PREFETCH_MAX_MB = int(os.getenv("PREFETCH_MAX_MB", "64"))
+
+@st.cache_resource
+def get_prefetch_executor():
+    return ThreadPoolExecutor(max(PREFETCH_WORKERS, 1), thread_name_prefix="prefetch")
+
+@st.cache_data(ttl=ERROR_COUNTS_TTL)
+def get_session_sizes(source, session_ids):
+    return get_log_store(*source).session_sizes(session_ids)
+
+def prefetch_session_graph(graph_cache, store, source, session_id, mode, budget, expanded, cancelled):
+    """Runs on the prefetch pool: no Streamlit calls in here."""
+    session = store.load_session_summary(session_id)
+    if session is None or not session.message_count or cancelled():
+        return
+    if mode == "Summary" or (mode == "Auto" and session.message_count > SUMMARY_GRAPH_THRESHOLD):
+        get_session_summary_graph(graph_cache, store, source, session, budget, expanded)
+    else:
+        get_session_graph(graph_cache, store, source, session)
+
+if "prefetcher" not in st.session_state:
+    st.session_state.prefetcher = Prefetcher(get_prefetch_executor(), PREFETCH_MAX_MB * 1024 * 1024)
+if PREFETCH_WORKERS and all_sessions and st.session_state.get("show_graph"):
+    listed_ids = tuple(s.get("sessionId") for s in all_sessions)
+    with perf.span("prefetch"):
+        session_sizes = get_session_sizes(log_source, listed_ids)
+        prefetch_tasks = []
+        for session_id in listed_ids:
+            expanded = tuple(sorted(st.session_state.get(f"graph_expanded_{session_id}", [])))
+            # Sessions the store could not measure are left out of the prefetch
+            prefetch_tasks.append((session_sizes.get(session_id), partial(
+                prefetch_session_graph, get_graph_cache(), log_store, log_source, session_id,
+                graph_mode, node_budget, expanded)))
+        st.session_state.prefetcher.replace((log_source, listed_ids, graph_mode, node_budget), prefetch_tasks)
+else:
+    st.session_state.prefetcher.cancel()
 
 # Main content area
 if st.session_state.selected_session:
     st.markdown(f"Selected Session: **{st.session_state.selected_session}**")
-    history = fetch_history(st.session_state.selected_session)
-    
-    # Fetch the session document to check for sfdcUserId
-    session_doc = list(history_collection.find({"sessionId": st.session_state.selected_session}).limit(1))
-    if session_doc and "sfdcUserId" in session_doc[0]:
-        st.markdown(f"Authenticated User: **{session_doc[0]['sfdcUserId']}**")
-    
-    # Generate graph and get tool names
-    graph, tool_names = generate_graph(history, scale=graph_scale)
-    
-    # Add download button for DOT source in sidebar
-    if history:
-        dot_source = get_graph_source(graph)
+    # Header fields only; the graph and history fetch the messages they need
+    with perf.span("session_summary"):
+        session = log_store.load_session_summary(st.session_state.selected_session)
+
+    if session and session.sfdc_user_id is not None:
+        st.markdown(f"Authenticated User: **{session.sfdc_user_id}**")
+
+    graph_cache = get_graph_cache()
+
+    # In live mode the tail holds the session in memory and only fetches appended messages
+    tail = None
+    if follow_session and session and log_store.supports_live_tail:
+        tail = get_session_tail(log_source, session.session_id, tail_interval)
+
+        @st.fragment(run_every=tail_interval)
+        def watch_session_tail():
+            if tail.poll():
+                st.rerun()
+            mode = "change stream" if tail.uses_change_stream else f"polling every {tail.current_interval:.0f}s"
+            st.caption(f"Following live: {len(tail.messages)} messages ({mode})")
+
+        watch_session_tail()
+    else:
+        close_session_tail()
+
+    # Folds and turns expanded in the summary graph, per session
+    expanded_key = f"graph_expanded_{st.session_state.selected_session}"
+
+    def use_summary_graph():
+        if graph_mode == "Auto":
+            message_count = len(tail.messages) if tail else session.message_count
+            return message_count > SUMMARY_GRAPH_THRESHOLD
+        return graph_mode == "Summary"
+
+    def current_summary_graph():
+        expanded = tuple(sorted(st.session_state.get(expanded_key, [])))
+        if tail:
+            return build_summary_graph(tail.messages, node_budget, expanded)
+        return get_session_summary_graph(graph_cache, log_store, log_source, session,
+                                         node_budget, expanded)
+
+    def current_graph():
+        if use_summary_graph():
+            return current_summary_graph().graph
+        if tail:
+            return tail.graph
+        return get_session_graph(graph_cache, log_store, log_source, session)
+
+    # Add download button for DOT source in sidebar; the graph is only built when downloaded
+    if session and session.message_count:
         st.sidebar.download_button(
             label="Download Graph Source (DOT)",
-            data=dot_source,
+            data=lambda: get_graph_source(render_graph(current_graph(), graph_scale)),
             file_name="agent_flow.dot",
             mime="text/plain"
         )
     st.sidebar.markdown("[Graphviz Online Viewer](https://dreampuf.github.io/GraphvizOnline/)")
+    cache_stats = graph_cache.stats()
+    st.sidebar.caption(
+        f"Graph cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses, "
+        f"{cache_stats['entries']} graphs, {cache_stats['bytes'] / 1048576:.1f} of "
+        f"{cache_stats['max_bytes'] / 1048576:.0f} MB"
+    )
     
     # Graph section
     st.header("Agent Flow Graph")
-    show_graph = st.checkbox("Show Graph", value=False)
+    show_graph = st.checkbox("Show Graph", value=False, key="show_graph")
     
-    if show_graph:
+    if show_graph and session:
         st.markdown(
             """
             <style>
@@ -343,11 +494,56 @@ if st.session_state.selected_session:
             unsafe_allow_html=True,
         )
         
+        # Finished sessions come from the layout cache when possible, so neither the graph nor its layout is rebuilt
+        summary_mode = use_summary_graph()
+        use_layout = server_layout and server_layout_available() and not tail and is_finished(session)
+        layout = None
+        with perf.span("graph") as graph_span:
+            if use_layout:
+                expanded = tuple(sorted(st.session_state.get(expanded_key, [])))
+                variant = ("summary", node_budget, expanded) if summary_mode else ("detailed",)
+                layouts = get_layout_cache(*log_source)
+                cache_key = layout_key(log_source, session.session_id, session.fingerprint, variant, graph_scale)
+                with perf.span("graph.layout_cache"):
+                    layout = layouts.get(cache_key)
+            folds = layout.folds if layout else {}
+            if layout is None:
+                # Generate graph (cached per session version) and apply the scale for display
+                if summary_mode:
+                    summary = current_summary_graph()
+                    folds = summary.folds
+                    graph = render_graph(summary.graph, graph_scale)
+                else:
+                    graph = render_graph(current_graph(), graph_scale)
+                if use_layout:
+                    try:
+                        with perf.span("graph.layout"), st.spinner("Laying out graph..."):
+                            layout = render_layout(graph, folds)
+                        layouts.put(cache_key, layout)
+                    except (graphviz.ExecutableNotFound, graphviz.CalledProcessError) as exc:
+                        st.caption(f"Server-side layout failed, laying out in the browser: {exc}")
+            if summary_mode:
+                # Drop expansions of folds that no longer exist, e.g. after the session grew
+                st.session_state[expanded_key] = [
+                    node_id for node_id in st.session_state.get(expanded_key, []) if node_id in folds
+                ]
+                st.multiselect("Expand Folded Nodes", list(folds), format_func=folds.get,
+                               key=expanded_key, help="Draw folded tool call cycles or collapsed turns in full")
+            if perf.measuring_sizes():
+                if layout:
+                    graph_span.fields["svg_bytes"] = len(layout.svg)
+                else:
+                    graph_span.fields["dot_bytes"] = len(graph.source)
+
         # Calculate dynamic middle column width based on max concurrent tools
-        middle_width = get_max_concurrent_tools(history)
+        max_parallel_calls = tail.max_parallel_calls if tail else session.max_parallel_calls
+        middle_width = max(max_parallel_calls, 3)  # Minimum width of 3 for readability
         col1, col2, col3 = st.columns([1, middle_width, 1])
         with col2:
-            st.graphviz_chart(graph, use_container_width=True)
+            if layout:
+                components.html(pan_zoom_html(layout.svg, LAYOUT_VIEWER_HEIGHT), height=LAYOUT_VIEWER_HEIGHT + 10)
+            else:
+                st.graphviz_chart(graph, use_container_width=True)
 
     # Execution History section
     st.header("Execution History")
@@ -355,7 +551,7 @@ if st.session_state.selected_session:
     # Common filter control for both graph and history with improved state management
     selected_roles = st.multiselect(
         "Filter by Role",
-        ["system", "user", "assistant", "tool", "error"],
+        FILTER_ROLES,
         default=st.session_state.filter_roles,
         key="role_multiselect",
         on_change=update_filter_roles
@@ -363,93 +559,98 @@ if st.session_state.selected_session:
     
     simplify_assistant_messages = st.checkbox("Simplify Assistant Messages with Tool Calls", value=True)
 
-    # Find tool names for TOOL messages
-    tool_function_names = {}
-    for i, message in enumerate(history):
-        if isinstance(message, dict) and message.get("role") == "assistant" and message.get("tool_calls"):
-            for tool_call in message["tool_calls"]:
-                tool_function_names[tool_call["id"]] = tool_call["function"]["name"]
-
-    # Updated filtering logic
-    filtered_history = []
-    selected_roles_lower = [role.lower() for role in selected_roles]
-    for message in history:
-        if isinstance(message, dict):
-            # Check if sl_role is missing and apply the workaround
-            if not message.get("sl_role"):
-                content = message.get("content", [])
-                if isinstance(content, list) and len(content) > 0:
-                    if message.get("role", "").lower() == "assistant" and len(content) > 1 and content[1].get("toolUse"):
-                        message["sl_role"] = "assistant (tool call)"
-                    elif message.get("role", "").lower() == "user" and content[0].get("toolResult"):
-                        message["sl_role"] = "tool (response)"
-                elif message.get("tool_calls"):
-                    message["sl_role"] = "assistant (tool call)"
-
-            # Improved filtering logic
-            message_role = message.get("sl_role", message.get("role", "")).lower()
-            
-            if message_role == "tool (response)" or (message.get("role", "").lower() == "user" and isinstance(message.get("content"), list) and len(message["content"]) > 0 and message["content"][0].get("toolResult")):
-                if "tool" in selected_roles_lower:
-                    filtered_history.append(message)
-            elif any(role in message_role for role in selected_roles_lower):
-                if message_role != "user" or not (isinstance(message.get("content"), list) and len(message["content"]) > 0 and message["content"][0].get("toolResult")):
-                    filtered_history.append(message)
-            elif "assistant" in selected_roles_lower and "tool" in message_role:
-                filtered_history.append(message)
-            elif message.get("tool_calls") and "assistant" in selected_roles_lower:
-                filtered_history.append(message)
+    # Only one page of the history is fetched and rendered per rerun
+    page_col, size_col, jump_col = st.columns(3)
+    history_page_size = size_col.selectbox("Messages per Page", [25, 50, 100, 200], key="history_page_size")
+
+    # Start from the first page whenever the session, filter or page size changes
+    history_key = (log_source, st.session_state.selected_session, tuple(selected_roles), history_page_size)
+    if st.session_state.get("history_key") != history_key:
+        st.session_state.history_page = 1
+    st.session_state.history_key = history_key
+
+    jump_col.number_input("Jump to Message ID", min_value=0, step=1, key="history_jump",
+                          on_change=request_history_jump,
+                          help="Message ID as shown in the history titles and graph nodes")
+    search_matches = st.session_state.get("search_matches")
+    if search_matches and search_matches[0] == st.session_state.selected_session:
+        st.selectbox("Search Matches", search_matches[1], index=None, key="search_match",
+                     on_change=jump_to_search_match,
+                     placeholder=f"{len(search_matches[1])} messages match \"{message_query.strip()}\"")
+    jump_target = st.session_state.pop("history_pending_jump", None)
+
+    # Role filter and page window are applied by MongoDB, so only this page's messages are transferred;
+    # a followed session is paged from the tail instead
+    def get_message_page(skip, jump_to=None):
+        with perf.span("history.page"):
+            if tail:
+                return paginate_messages(tail.messages, tail.session_index, selected_roles,
+                                         skip=skip, limit=history_page_size, jump_to=jump_to)
+            return log_store.load_message_page(st.session_state.selected_session, selected_roles,
+                                               skip=skip, limit=history_page_size, jump_to=jump_to)
+
+    requested_page = st.session_state.get("history_page", 1)
+    message_page = get_message_page((requested_page - 1) * history_page_size, jump_target)
+    if message_page and message_page.skip >= message_page.total > 0:
+        # The filtered history got shorter than the current page
+        message_page = get_message_page(0)
+    total_messages = message_page.total if message_page else 0
+    page_messages = message_page.messages if message_page else []
+    page_start = message_page.skip if message_page else 0
+    page_count = max(1, math.ceil(total_messages / history_page_size))
+    st.session_state.history_page = page_start // history_page_size + 1
+
+    if jump_target and (not message_page or message_page.position < 0):
+        st.warning(f"Message {jump_target} is not in the filtered history.")
+        jump_target = None
+
+    page_col.number_input("Page", min_value=1, max_value=page_count, step=1, key="history_page")
 
     # Update the display logic
-    if filtered_history:
-        for i, message in enumerate(filtered_history):
-            role = message.get('sl_role') or message.get('role', 'Output')
-            
-            # Determine the display title
-            if role.lower() == "tool (response)" or (message.get("role", "").lower() == "user" and isinstance(message.get("content"), list) and len(message["content"]) > 0 and message["content"][0].get("toolResult")):
-                tool_result = message["content"][0].get("toolResult", {})
-                tool_use_id = tool_result.get("toolUseId", "")
-                # Find the corresponding tool call in previous messages
-                tool_name = "Unknown"
-                for prev_message in filtered_history[:i]:
-                    if isinstance(prev_message.get("content"), list) and len(prev_message["content"]) > 1:
-                        tool_use = prev_message["content"][1].get("toolUse", {})
-                        if tool_use.get("toolUseId") == tool_use_id:
-                            tool_name = tool_use.get("name", "Unknown")
-                            break
-                display_title = f"Message {i + 1} - TOOL ({tool_name})"
-            elif role.lower().startswith("tool ("):
-                tool_name = role[5:-1]  # Extract tool name from "TOOL (tool_name)"
-                display_title = f"Message {i + 1} - TOOL ({tool_name})"
-            elif role.upper() == "TOOL" and message.get("function_id"):
-                tool_name = tool_function_names.get(message['function_id'], 'Unknown')
-                display_title = f"Message {i + 1} - TOOL ({tool_name})"
-            else:
-                display_title = f"Message {i + 1} - {role.upper()}"
-            
-            with st.expander(display_title):
-                # Rest of the display logic remains the same
-                if simplify_assistant_messages and \
-                    (message.get("tool_calls") or (isinstance(message.get("content"), list) and len(message["content"]) > 1 and message["content"][1].get("toolUse"))) and \
-                    (message.get("role", "").lower() == "assistant" or \
-                     message.get("sl_role", "").lower() == "assistant"):
-                    st.json(message, expanded=False)
+    if page_messages:
+        st.caption(f"Showing {page_start + 1}-{page_start + len(page_messages)} of {total_messages} messages")
+        with perf.span("history.render", messages=len(page_messages)):
+            for message in page_messages:
+                role = message.role
+                i = message.index
+
+                # Determine the display title
+                if role.lower().startswith("tool (") and role.lower() != "tool (response)":
+                    tool_name = role[5:-1]  # Extract tool name from "TOOL (tool_name)"
+                    display_title = f"Message {i} - TOOL ({tool_name})"
+                elif message.kind == TOOL_RESPONSE and message.response_ids:
+                    links = message_page.session_index.response_links(message)
+                    tool_name = links[0].name if links else "Unknown"
+                    display_title = f"Message {i} - TOOL ({tool_name})"
                 else:
-                    st.json(message)
-                    
-                if message.get("tool_calls") or (isinstance(message.get("content"), list) and len(message["content"]) > 1 and message["content"][1].get("toolUse")):
-                    st.subheader("Tool Calls")
-                    if message.get("tool_calls"):
-                        for tool_call in message["tool_calls"]:
-                            st.write(f"**Function:** {tool_call.get('function', {}).get('name', 'N/A')}")
-                            arguments = tool_call.get('function', {}).get('arguments', 'N/A')
-                            st.json(arguments, expanded=True)
-                    elif isinstance(message.get("content"), list) and len(message["content"]) > 1 and message["content"][1].get("toolUse"):
-                        tool_use = message["content"][1]["toolUse"]
-                        st.write(f"**Function:** {tool_use.get('name', 'N/A')}")
-                        input_data = tool_use.get('input', {})
-                        st.json(input_data, expanded=True)
+                    display_title = f"Message {i} - {role.upper()}"
+
+                # Bodies are only serialized while their expander is open
+                message_key = f"history_{st.session_state.selected_session}_{i}"
+                expander = st.expander(display_title, expanded=i == jump_target, key=message_key, on_change="rerun")
+                if not expander.open:
+                    continue
+
+                with expander:
+                    if message.kind == TOOL_RESPONSE:
+                        for link in message_page.session_index.response_links(message):
+                            st.caption(f"Response to {link.name} called in message {link.call_index} "
+                                       f"({i - link.call_index} messages earlier)")
+
+                    if simplify_assistant_messages and message.kind == TOOL_CALL:
+                        show_json(message.raw, f"{message_key}_full", expanded=False)
+                    else:
+                        show_json(message.raw, f"{message_key}_full")
+
+                    if message.tool_calls:
+                        st.subheader("Tool Calls")
+                        for y, (_, tool_name, arguments) in enumerate(message.tool_calls):
+                            st.write(f"**Function:** {tool_name}")
+                            show_json(arguments, f"{message_key}_args_{y}")
     else:
         st.info("No messages match the selected filter.")
 else:
+    close_session_tail()
     st.markdown("No session selected")
+
+end_rerun()
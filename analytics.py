@@ -0,0 +1,101 @@
+"""Cross-session metrics for the analytics view.
+
+Each Log document is reduced to a small rollup record once: by the aggregation in
+session_store.update_rollups() for MongoDB, run by rollup_sessions.py, and by
+session_rollup() while indexing export files. The functions below turn a list of
+rollups into the tables behind the charts with pandas, without looping over
+sessions in Python.
+"""
+from collections import Counter
+
+import pandas as pd
+
+from message_model import ASSISTANT, TOOL_CALL, normalize_messages
+from session_store import NO_TOOL
+
+ROLLUP_COLUMNS = ["_id", "sessionId", "agentName", "messageCount", "turns", "errors", "toolCalls", "errorTools"]
+
+
+def _name_counts(counter):
+    return [{"name": name, "count": count} for name, count in counter.items()]
+
+
+def session_rollup(doc):
+    """Rollup record of one Log document, the same as the MongoDB rollup pipeline produces."""
+    raw_messages = doc.get("messages") or []
+    turns = errors = 0
+    tool_calls = Counter()
+    error_tools = Counter()
+    last_tool = None
+    for message in normalize_messages(raw_messages):
+        if message.kind in (ASSISTANT, TOOL_CALL):
+            turns += 1
+        if message.is_error:
+            errors += 1
+            error_tools[last_tool or NO_TOOL] += 1
+        for name in message.tool_names:
+            tool_calls[name] += 1
+            last_tool = name
+    return {
+        "_id": doc.get("_id"),
+        "sessionId": doc.get("sessionId"),
+        "agentName": doc.get("agentName"),
+        "messageCount": len(raw_messages),
+        "turns": turns,
+        "errors": errors,
+        "toolCalls": _name_counts(tool_calls),
+        "errorTools": _name_counts(error_tools),
+    }
+
+
+def rollup_frame(rollups):
+    frame = pd.DataFrame(list(rollups), columns=ROLLUP_COLUMNS)
+    frame["agentName"] = frame["agentName"].fillna("(unknown)")
+    return frame
+
+
+def agent_summary(frame):
+    """Sessions, error rates and median turns per agent."""
+    grouped = frame.assign(hasErrors=frame["errors"] > 0).groupby("agentName")
+    summary = grouped.agg(
+        sessions=("sessionId", "size"),
+        messages=("messageCount", "sum"),
+        errors=("errors", "sum"),
+        sessions_with_errors=("hasErrors", "mean"),
+        median_turns=("turns", "median"),
+    )
+    summary["error_rate"] = summary["errors"] / summary["messages"].where(summary["messages"] > 0)
+    return summary.sort_values("sessions", ascending=False)
+
+
+def _name_count_table(frame, column):
+    """Long table of agentName, name, count from a column of [{name, count}] lists."""
+    exploded = frame[["agentName", column]].explode(column).dropna(subset=[column])
+    if exploded.empty:
+        return pd.DataFrame(columns=["agentName", "name", "count"])
+    table = pd.DataFrame({
+        "agentName": exploded["agentName"].to_numpy(),
+        "name": exploded[column].str.get("name").to_numpy(),
+        "count": exploded[column].str.get("count").to_numpy(),
+    })
+    return table.groupby(["agentName", "name"], as_index=False)["count"].sum()
+
+
+def tool_frequency(frame):
+    """Tool calls per agent and tool."""
+    return _name_count_table(frame, "toolCalls")
+
+
+def error_precursors(frame):
+    """Errors per agent and the tool called most recently before them."""
+    return _name_count_table(frame, "errorTools")
+
+
+def top_names(table, limit=20):
+    """Agent-by-name matrix of the ``limit`` most frequent names, for stacked bar charts."""
+    if table.empty:
+        return pd.DataFrame()
+    totals = table.groupby("name")["count"].sum().nlargest(limit)
+    matrix = table[table["name"].isin(totals.index)].pivot_table(
+        index="name", columns="agentName", values="count", aggfunc="sum", fill_value=0)
+    return matrix.loc[totals.index]
@@ -0,0 +1,33 @@
+"""Replace files whole, so readers in other threads, processes or replicas never see half of one."""
+import os
+import uuid
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path, mode="w", keep_partial=False):
+    """Open a temporary file next to ``path`` for writing and rename it over ``path`` at the end.
+
+    Every call gets its own temporary file, so concurrent writers of the same path never
+    share one; the last rename wins. Unlike tempfile.mkstemp() the file gets the usual
+    umask permissions, so collectors and other replicas can read the result. When the
+    block raises, the temporary file is removed and ``path`` left alone, unless
+    ``keep_partial`` is set for files that are valid up to any line, such as the export
+    manifest.
+    """
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporary, mode.replace("w", "x"), encoding=None if "b" in mode else "utf-8") as f:
+            try:
+                yield f
+            except BaseException:
+                if not keep_partial:
+                    raise
+                f.close()
+                os.replace(temporary, path)
+                raise
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
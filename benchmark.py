@@ -0,0 +1,200 @@
+"""Headless benchmarks for graph building, DOT output, role filtering, history pages and search.
+
+Runs on synthetic sessions from synthetic_sessions.py; needs neither Streamlit nor MongoDB.
+
+    python benchmark.py                      # compare with benchmark_baseline.json
+    python benchmark.py --update-baseline    # record the baseline on this machine
+    python benchmark.py --max-messages 10000 --cases graph,filter
+
+Timings depend on the machine, so compare against a baseline recorded on the same
+one. Each case is the median of several runs, and the baseline is scaled by how much
+faster or slower a fixed calibration workload runs now than when it was recorded, so
+load and clock changes on the machine are not reported as regressions. Cases that
+come out slower are timed again, and the exit status is 1 when a case stays slower
+than the scaled baseline by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import timeit
+
+from analytics import session_rollup
+from flow_graph import build_graph, build_summary_graph
+from message_model import FILTER_ROLES, TOOL_RESPONSE, SessionIndex, filter_messages, normalize_messages
+from search_index import SearchIndex, search_indexes
+from session_store import paginate_messages
+from synthetic_sessions import STYLES, generate_session
+
+SIZES = [10, 100, 1000, 10000, 100000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# Role selections timed by the filter case
+ROLE_SETS = [FILTER_ROLES, ["tool"], ["error"], ["assistant"], ["user", "system"]]
+HISTORY_PAGE_SIZE = 50
+# Query timed by the search case: a rare tool name and a common word
+SEARCH_QUERY = "PlanStoryStructure failed"
+# Slowdowns smaller than this are noise, whatever the ratio
+MIN_REGRESSION_SECONDS = 0.0005
+# Baseline entry of the calibration workload
+CALIBRATION_KEY = "calibration"
+# Cases slower than the baseline are timed again this many times, and only reported if they stay slower
+CONFIRM_RUNS = 2
+
+
+def _history_page(messages, session_index, skip):
+    """What the history section prepares for one page: the page, titles and the bodies of open expanders."""
+    page = paginate_messages(messages, session_index, FILTER_ROLES, skip=skip, limit=HISTORY_PAGE_SIZE)
+    titles = []
+    for message in page.messages:
+        if message.kind == TOOL_RESPONSE:
+            links = page.session_index.response_links(message)
+            titles.append(f"Message {message.index} - TOOL ({links[0].name if links else 'Unknown'})")
+        else:
+            titles.append(f"Message {message.index} - {message.role.upper()}")
+        json.dumps(message.raw, indent=2, default=str)
+    return titles
+
+
+def _calibration():
+    """Fixed workload independent of this repo's code, the yardstick for the machine's speed."""
+    data = [{"id": i, "name": f"tool_{i % 17}", "args": list(range(i % 10))} for i in range(2000)]
+    return sorted(json.loads(json.dumps(data)), key=lambda item: (item["name"], -item["id"]))
+
+
+def benchmark_cases(doc):
+    """name -> function timing one operation on the session ``doc``."""
+    raw_messages = doc["messages"]
+    messages = normalize_messages(raw_messages)
+    session_index = SessionIndex(messages)
+    graph = build_graph(messages, session_index)
+    last_page = max(len(messages) - 1, 0) // HISTORY_PAGE_SIZE * HISTORY_PAGE_SIZE
+    search_index = SearchIndex()
+    search_index.add(0, messages)
+
+    return {
+        "normalize": lambda: SessionIndex(normalize_messages(raw_messages)),
+        "graph": lambda: build_graph(messages, session_index),
+        "summary_graph": lambda: build_summary_graph(messages),
+        "dot": lambda: graph.source,
+        "filter": lambda: [filter_messages(messages, roles) for roles in ROLE_SETS],
+        "history_page": lambda: (_history_page(messages, session_index, 0),
+                                 _history_page(messages, session_index, last_page)),
+        "rollup": lambda: session_rollup(doc),
+        "search_index": lambda: SearchIndex().add(0, messages),
+        "search": lambda: list(search_indexes([search_index], SEARCH_QUERY)),
+    }
+
+
+def time_case(function, repeat=5):
+    """Median time per call in seconds, over ``repeat`` runs of at least 0.2 s each."""
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return statistics.median(timer.repeat(repeat, number)) / number
+
+
+def run(sizes, styles, cases, repeat=5, keys=None, **session_options):
+    """Time the cases, plus the calibration workload; ``keys`` limits them to some style/size/case keys."""
+    results = {CALIBRATION_KEY: time_case(_calibration, repeat)}
+    print(f"{CALIBRATION_KEY:<32} {results[CALIBRATION_KEY] * 1000:>12.3f} ms", flush=True)
+    for style in styles:
+        for size in sizes:
+            if keys is not None and not any(key.startswith(f"{style}/{size}/") for key in keys):
+                continue
+            doc = generate_session(size, style=style, **session_options)
+            for name, function in benchmark_cases(doc).items():
+                key = f"{style}/{size}/{name}"
+                if (cases and name not in cases) or (keys is not None and key not in keys):
+                    continue
+                results[key] = time_case(function, repeat)
+                print(f"{key:<32} {results[key] * 1000:>12.3f} ms", flush=True)
+    return results
+
+
+def slower_cases(results, baseline, tolerance):
+    """key -> (seconds, baseline seconds) of the cases more than ``tolerance`` slower than the baseline.
+
+    The baseline is scaled to the machine's current speed first.
+    """
+    scale = 1.0
+    if baseline.get(CALIBRATION_KEY) and results.get(CALIBRATION_KEY):
+        scale = results[CALIBRATION_KEY] / baseline[CALIBRATION_KEY]
+        print(f"Machine speed relative to the baseline: baseline timings scaled by {scale:.2f}")
+    slower = {}
+    for key, seconds in results.items():
+        expected = baseline.get(key)
+        if expected is None or key == CALIBRATION_KEY:
+            continue
+        expected *= scale
+        if seconds > expected * (1 + tolerance) and seconds - expected > MIN_REGRESSION_SECONDS:
+            slower[key] = (seconds, expected)
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated message counts")
+    parser.add_argument("--max-messages", type=int, help="skip sizes above this")
+    parser.add_argument("--styles", default=",".join(STYLES), help="openai, bedrock or both")
+    parser.add_argument("--cases", default="", help="comma-separated case names, default all")
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--parallel-calls", type=int, default=3)
+    parser.add_argument("--error-ratio", type=float, default=0.02)
+    parser.add_argument("--payload-size", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the median is reported")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed slowdown, 0.5 = 50%%")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="store these timings as the baseline")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    if args.max_messages:
+        sizes = [size for size in sizes if size <= args.max_messages]
+    styles = args.styles.split(",")
+    cases = set(filter(None, args.cases.split(",")))
+    session_options = dict(turns=args.turns, parallel_calls=args.parallel_calls, error_ratio=args.error_ratio,
+                           payload_size=args.payload_size)
+    results = run(sizes, styles, cases, repeat=args.repeat, **session_options)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        if baseline.get(CALIBRATION_KEY):
+            # Keep the recorded timings comparable: store these at the speed of the existing baseline
+            scale = baseline[CALIBRATION_KEY] / results.pop(CALIBRATION_KEY)
+            results = {key: seconds * scale for key, seconds in results.items()}
+        baseline.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline first")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    slower = slower_cases(results, baseline, args.tolerance)
+    # A single slow timing is often the machine being busy: only cases that stay slow are regressions
+    for _ in range(CONFIRM_RUNS):
+        if not slower:
+            break
+        print(f"Timing {len(slower)} slower cases again")
+        retimed = run(sizes, styles, cases, repeat=args.repeat, keys=set(slower), **session_options)
+        slower = {key: timings for key, timings in slower_cases(retimed, baseline, args.tolerance).items()
+                  if key in slower}
+    for key, (seconds, expected) in sorted(slower.items()):
+        print(f"REGRESSION {key}: {seconds * 1000:.3f} ms, baseline {expected * 1000:.3f} ms "
+              f"({seconds / expected - 1:+.0%})")
+    timed = len(results) - 1
+    if slower:
+        print(f"{len(slower)} of {timed} cases regressed")
+        return 1
+    print(f"No regressions in {timed} cases")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
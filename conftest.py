@@ -0,0 +1,34 @@
+"""Shared pytest fixtures.
+
+Tests that need a real MongoDB connect to TEST_MONGO_URI (default: a mongod on
+localhost) and are skipped when none answers; mongomock does not run the
+aggregation pipelines of session_store.
+"""
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+TEST_MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017")
+
+
+@pytest.fixture(scope="session")
+def mongo_client():
+    client = MongoClient(TEST_MONGO_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError as exc:
+        client.close()
+        pytest.skip(f"No MongoDB at {TEST_MONGO_URI}: {exc}")
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def mongo_database(mongo_client):
+    """A scratch database, dropped after the test."""
+    name = f"agent_hub_test_{uuid.uuid4().hex[:12]}"
+    yield mongo_client.get_database(name)
+    mongo_client.drop_database(name)
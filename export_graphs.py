@@ -0,0 +1,261 @@
+"""Batch export of session flow graphs, without Streamlit.
+
+    python export_graphs.py --database snaplogic --agent storyteller --out graphs/
+    python export_graphs.py --export-path dumps/ --session-ids a,b --formats dot,svg
+    python export_graphs.py --database snaplogic --min-id 2026-10-17 --max-id 2026-10-18 --workers 8
+
+Sessions are streamed from the MongoDB cursor (or the export file index) and built in
+a process pool, with a bounded number of documents in flight, so memory does not grow
+with the selection. Each session gets <out>/<sessionId>.dot, plus .svg/.png rendered
+by the local Graphviz ``dot`` binary when asked for, and a line in <out>/manifest.jsonl.
+Running again into the same directory skips sessions whose fingerprint and graph
+settings did not change. The exit status is 1 when any session failed.
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+
+import graphviz
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from atomic_files import atomic_write
+from file_store import FileLogStore
+from flow_graph import DEFAULT_NODE_BUDGET, SUMMARY_GRAPH_THRESHOLD, build_graph, build_summary_graph, render_graph
+from message_model import normalize_messages
+from session_store import MongoLogStore, Session
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("dot", "svg", "png")
+MANIFEST_NAME = "manifest.jsonl"
+GRAPH_MODES = ("auto", "detailed", "summary")
+# Documents handed to the pool per worker before waiting for results
+IN_FLIGHT_PER_WORKER = 2
+PROGRESS_EVERY = 100
+
+
+def parse_id_bound(text):
+    """An _id bound given as an ObjectId or an ISO date/time (UTC unless it has an offset)."""
+    if ObjectId.is_valid(text):
+        return ObjectId(text)
+    try:
+        moment = datetime.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"{text!r} is neither an ObjectId nor an ISO date") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return ObjectId.from_datetime(moment)
+
+
+def file_stem(session_id):
+    return re.sub(r"[^\w.-]", "_", session_id or "unknown")[:150]
+
+
+def graph_settings(mode, node_budget, scale):
+    """Key of the options that change the output; a session is rebuilt when it changes."""
+    return f"{mode}:{node_budget}:{scale:g}"
+
+
+def export_session(doc, stem, out_dir, formats, mode, node_budget, scale):
+    """Build and write one session's graph; returns its manifest entry. Runs in a worker process.
+
+    A session that cannot be built gets an entry with an "error" instead of failing the run.
+    """
+    started = time.perf_counter()
+    session = Session.from_document(doc)
+    entry = {
+        "sessionId": session.session_id,
+        "id": str(session.doc_id),
+        "agentName": session.agent_name,
+        "messageCount": session.message_count,
+        "fingerprint": session.fingerprint,
+        "settings": graph_settings(mode, node_budget, scale),
+        "files": [],
+    }
+    try:
+        messages = normalize_messages(session.messages)
+        summary = mode == "summary" or (mode == "auto" and session.message_count > SUMMARY_GRAPH_THRESHOLD)
+        entry["graph"] = "summary" if summary else "detailed"
+        graph = build_summary_graph(messages, node_budget).graph if summary else build_graph(messages)
+        if scale != 1.0:
+            graph = render_graph(graph, scale)
+    except Exception as exc:
+        # Messages of an unexpected shape; the other sessions are still exported
+        entry["error"] = f"{type(exc).__name__}: {exc}"
+        entry["seconds"] = round(time.perf_counter() - started, 3)
+        return entry
+
+    for output_format in formats:
+        file_name = f"{stem}.{output_format}"
+        try:
+            data = graph.source.encode("utf-8") if output_format == "dot" else graph.pipe(format=output_format)
+        except (graphviz.ExecutableNotFound, graphviz.CalledProcessError) as exc:
+            entry["error"] = f"{output_format}: {exc}"
+            continue
+        with open(os.path.join(out_dir, file_name), "wb") as f:
+            f.write(data)
+        entry["files"].append(file_name)
+    entry["seconds"] = round(time.perf_counter() - started, 3)
+    return entry
+
+
+def read_manifest(path):
+    """Entries of a previous run by document _id, or {} when there is none."""
+    entries = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries[entry["id"]] = entry
+    except (OSError, ValueError) as exc:
+        if os.path.exists(path):
+            logger.warning("Ignoring unreadable manifest %s: %s", path, exc)
+    return entries
+
+
+def _entry_stem(entry):
+    return os.path.splitext(entry["files"][0])[0] if entry and entry.get("files") else None
+
+
+def is_current(entry, session, settings, formats, out_dir):
+    """Whether a previous manifest entry already covers this session version."""
+    return (entry is not None and "error" not in entry
+            and entry["fingerprint"] == session.fingerprint and entry["settings"] == settings
+            and all(f"{_entry_stem(entry)}.{output_format}" in entry["files"] for output_format in formats)
+            and all(os.path.exists(os.path.join(out_dir, name)) for name in entry["files"]))
+
+
+def open_store(args):
+    if args.export_path:
+        return FileLogStore(os.path.abspath(args.export_path))
+    uri = args.uri or os.getenv("MONGO_URI")
+    if not uri:
+        raise SystemExit("Set MONGO_URI or pass --uri, or use --export-path")
+    return MongoLogStore(MongoClient(uri).get_database(args.database).get_collection("Log"))
+
+
+def run(store, out_dir, selection, formats, mode, node_budget, scale, workers, force=False):
+    """Export the selected sessions; returns (exported, skipped, failed) counts."""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    previous = read_manifest(manifest_path)
+    settings = graph_settings(mode, node_budget, scale)
+    # File stem -> document _id, including the sessions exported by earlier runs
+    stems = {_entry_stem(entry): doc_id for doc_id, entry in previous.items() if _entry_stem(entry)}
+    exported = skipped = failed = 0
+    submitted = {}  # future -> (document _id, sessionId)
+
+    def record(entry):
+        nonlocal exported, failed
+        manifest.write(json.dumps(entry) + "\n")
+        if "error" in entry:
+            failed += 1
+            logger.warning("Session %s: %s", entry["sessionId"], entry["error"])
+        else:
+            exported += 1
+        if (exported + failed) % PROGRESS_EVERY == 0:
+            logger.info("%s sessions exported, %s skipped, %s failed", exported, skipped, failed)
+
+    def collect(futures):
+        for future in futures:
+            doc_id, session_id = submitted.pop(future)
+            try:
+                entry = future.result()
+            except Exception as exc:
+                # The worker itself failed, e.g. it was killed or the document could not be sent to it
+                entry = {"sessionId": session_id, "id": doc_id, "files": [], "error": f"{type(exc).__name__}: {exc}"}
+            record(entry)
+
+    # An interrupted run still replaces the manifest with what it got done
+    with atomic_write(manifest_path, keep_partial=True) as manifest:
+        try:
+            with ProcessPoolExecutor(workers) as pool:
+                pending = set()
+                for doc in store.iter_session_documents(**selection):
+                    session = Session.from_document(doc)
+                    doc_id = str(session.doc_id)
+                    entry = previous.pop(doc_id, None)
+                    if not force and is_current(entry, session, settings, formats, out_dir):
+                        manifest.write(json.dumps(entry) + "\n")
+                        skipped += 1
+                        continue
+                    stem = _entry_stem(entry) or file_stem(session.session_id)
+                    if stems.get(stem, doc_id) != doc_id:
+                        # Repeated sessionIds, or ids that only differ in characters not allowed in file names
+                        stem = f"{stem}-{doc_id}"
+                    stems[stem] = doc_id
+                    future = pool.submit(export_session, doc, stem, out_dir, formats, mode, node_budget, scale)
+                    submitted[future] = (doc_id, session.session_id)
+                    pending.add(future)
+                    if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                collect(wait(pending).done)
+        finally:
+            # When the run was interrupted, record what the workers finished and keep the sessions exported by
+            # earlier runs listed while their files are there, so the next run does not redo them
+            collect([future for future in list(submitted) if future.done() and not future.cancelled()])
+            for entry in previous.values():
+                if all(os.path.exists(os.path.join(out_dir, name)) for name in entry.get("files", [])):
+                    manifest.write(json.dumps(entry) + "\n")
+    return exported, skipped, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--database", help="MongoDB database holding the Log collection")
+    source.add_argument("--export-path", help="Log export file or directory, as in the dashboard")
+    parser.add_argument("--uri", help="MongoDB connection string, default $MONGO_URI")
+    parser.add_argument("--agent", help="only sessions of this agent")
+    parser.add_argument("--session-ids", default="", help="comma-separated sessionIds")
+    parser.add_argument("--session-ids-file", help="file with one sessionId per line")
+    parser.add_argument("--min-id", type=parse_id_bound, help="lowest _id, ObjectId or ISO date (inclusive)")
+    parser.add_argument("--max-id", type=parse_id_bound, help="highest _id, ObjectId or ISO date (inclusive)")
+    parser.add_argument("--out", default="graphs", help="output directory")
+    parser.add_argument("--formats", default="dot", help="comma-separated, from dot, svg and png")
+    parser.add_argument("--mode", choices=GRAPH_MODES, default="auto",
+                        help=f"auto uses the summary graph above {SUMMARY_GRAPH_THRESHOLD} messages")
+    parser.add_argument("--node-budget", type=int, default=DEFAULT_NODE_BUDGET)
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--force", action="store_true", help="rebuild sessions that are already exported")
+    args = parser.parse_args(argv)
+
+    formats = [output_format for output_format in args.formats.split(",") if output_format]
+    unknown = set(formats) - set(FORMATS)
+    if unknown or not formats:
+        parser.error(f"--formats takes {', '.join(FORMATS)}")
+    if set(formats) - {"dot"}:
+        try:
+            graphviz.version()
+        except graphviz.ExecutableNotFound:
+            parser.error("rendering svg or png needs the Graphviz dot executable on PATH")
+    session_ids = [session_id for session_id in args.session_ids.split(",") if session_id]
+    if args.session_ids_file:
+        with open(args.session_ids_file, encoding="utf-8") as f:
+            session_ids += [line.strip() for line in f if line.strip()]
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    load_dotenv()
+    started = time.perf_counter()
+    selection = {"agent_name": args.agent, "session_ids": session_ids or None,
+                 "min_id": args.min_id, "max_id": args.max_id}
+    exported, skipped, failed = run(open_store(args), args.out, selection, formats, args.mode,
+                                    args.node_budget, args.scale, max(args.workers, 1), force=args.force)
+    print(f"{exported} sessions exported, {skipped} unchanged, {failed} failed "
+          f"in {time.perf_counter() - started:.1f}s; manifest in {os.path.join(args.out, MANIFEST_NAME)}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
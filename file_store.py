@@ -0,0 +1,387 @@
+"""Read-only Log store backed by exported files instead of MongoDB.
+
+Accepts a single export or a directory of them: Extended JSON files (one document,
+an array of documents or documents back to back, as written by mongoexport --jsonArray
+or Compass) and JSONL/NDJSON dumps with one document per line. The first open streams
+through every file once and writes a sessionId/agentName -> byte offset index, along
+with each session's analytics rollup, next to the exports; later opens reuse it, re-indexing only files whose size or mtime changed.
+Sessions are then read with a single seek, so lookups don't depend on the dump size.
+Message search builds an in-memory search_index.SearchIndex per file on first use.
+
+FileLogStore offers the same methods as session_store.MongoLogStore.
+"""
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from bson import json_util
+
+from analytics import session_rollup
+from atomic_files import atomic_write
+from message_model import SessionIndex, normalize_messages
+from search_index import SearchHit, SearchIndex, search_indexes
+from session_store import SEARCH_LIMIT, Session, SessionPage, paginate_messages
+
+logger = logging.getLogger(__name__)
+
+EXPORT_EXTENSIONS = (".json", ".jsonl", ".ndjson")
+# Extensions read line by line instead of being scanned for document boundaries
+LINE_EXTENSIONS = (".jsonl", ".ndjson")
+INDEX_SUFFIX = ".agent-hub-index.json"
+INDEX_VERSION = 3
+# Parsed sessions kept in memory, so reruns of the page and prefetched sessions don't re-read the file
+SESSION_CACHE_SIZE = 10
+
+# Characters that matter while looking for the end of a document
+_STRUCTURE = re.compile(rb'[{}"]')
+# The rest of a string after its opening quote, escapes included
+_STRING_REST = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+
+def iter_documents(path):
+    """Yield (offset, raw bytes) for each top-level document of an export file."""
+    if path.lower().endswith(LINE_EXTENSIONS):
+        yield from _iter_lines(path)
+    else:
+        yield from _scan_documents(path)
+
+
+def _iter_lines(path):
+    offset = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield offset, line.rstrip(b"\r\n")
+            offset += len(line)
+
+
+def _scan_documents(path):
+    """Find document boundaries by brace depth, skipping over strings.
+
+    Only braces are counted, so documents are found the same way whether they are
+    inside a top-level array or simply follow each other. The file is memory-mapped
+    and each string is skipped by a single regex match.
+    """
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        depth = 0
+        start = None
+        position = 0
+        while True:
+            match = _STRUCTURE.search(mm, position)
+            if match is None:
+                break
+            token = match.group()
+            position = match.end()
+            if token == b'"':
+                string_end = _STRING_REST.match(mm, position)
+                if string_end is None:
+                    break
+                position = string_end.end()
+            elif token == b"{":
+                if depth == 0:
+                    start = match.start()
+                depth += 1
+            elif depth:
+                depth -= 1
+                if depth == 0:
+                    yield start, mm[start:position]
+        if depth:
+            logger.warning("Ignoring truncated document at byte %s of %s", start, path)
+
+
+def export_files(path):
+    """The export files at ``path``: the file itself or the exports directly in the directory."""
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, name) for name in os.listdir(path)
+            if name.lower().endswith(EXPORT_EXTENSIONS) and not name.endswith(INDEX_SUFFIX)
+        )
+    return [path]
+
+
+def index_path(path):
+    if os.path.isdir(path):
+        return os.path.join(path, INDEX_SUFFIX)
+    return path + INDEX_SUFFIX
+
+
+def index_file(path):
+    """One streaming pass over an export: an index entry per document, in file order."""
+    entries = []
+    for offset, raw in iter_documents(path):
+        try:
+            doc = json_util.loads(raw)
+        except ValueError as exc:
+            logger.warning("Skipping unreadable document at byte %s of %s: %s", offset, path, exc)
+            continue
+        if not isinstance(doc, dict) or not doc.get("sessionId"):
+            continue
+        # The rollup (sessionId, agentName, error count and the analytics metrics) comes along for free
+        try:
+            entry = session_rollup(doc)
+        except (AttributeError, KeyError, TypeError, ValueError) as exc:
+            # Messages of an unexpected shape; the rest of the dump stays usable
+            logger.warning("Skipping session %s at byte %s of %s: %s", doc["sessionId"], offset, path, exc)
+            continue
+        del entry["_id"]
+        doc_id = doc.get("_id")
+        if doc_id is None:
+            doc_id = _synthetic_id(path, offset)
+        entry.update(offset=offset, length=len(raw), id=json_util.dumps(doc_id))
+        entries.append(entry)
+    return entries
+
+
+def _synthetic_id(path, offset):
+    """Stable _id for a document exported without one: its file and position, in file order."""
+    return f"{os.path.basename(path)}@{offset:015d}"
+
+
+def _read_at(file_path, entry):
+    with open(file_path, "rb") as f:
+        f.seek(entry["offset"])
+        doc = json_util.loads(f.read(entry["length"]))
+    if doc.get("_id") is None:
+        doc["_id"] = json_util.loads(entry["id"])
+    return doc
+
+
+def _sort_key(doc_id):
+    # ObjectIds compare like their hex strings, which is creation order
+    return str(doc_id)
+
+
+class FileLogStore:
+    """Log documents served from export files through a persistent byte-offset index."""
+
+    supports_live_tail = False
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}     # file name -> {"size", "mtime", "entries"}
+        self._sessions = []  # (sort key, _id, file path, entry), oldest first
+        self._keys = []      # sort keys of _sessions, for bisecting keyset cursors
+        self._by_session = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._search = {}    # file name -> ((size, mtime), SearchIndex over its entries)
+        self._search_lock = threading.Lock()
+        self._load_index()
+        self.refresh()
+
+    def _load_index(self):
+        try:
+            with open(index_path(self.path), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") == INDEX_VERSION:
+            self._files = index.get("files", {})
+
+    def _save_index(self):
+        try:
+            # Concurrent reruns and other processes never read half an index
+            with atomic_write(index_path(self.path)) as f:
+                json.dump({"version": INDEX_VERSION, "files": self._files}, f)
+        except OSError as exc:
+            # Read-only locations still work, they just get indexed on every open
+            logger.warning("Could not write index for %s: %s", self.path, exc)
+
+    def refresh(self):
+        """Re-index export files that were added or changed since the index was written."""
+        files = {}
+        changed = False
+        for file_path in export_files(self.path):
+            stat = os.stat(file_path)
+            name = os.path.basename(file_path)
+            known = self._files.get(name)
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime_ns:
+                files[name] = known
+                continue
+            logger.info("Indexing %s", file_path)
+            files[name] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "entries": index_file(file_path)}
+            changed = True
+        if changed or files.keys() != self._files.keys():
+            self._files = files
+            self._save_index()
+        elif self._sessions:
+            return
+
+        sessions = []
+        for name, info in self._files.items():
+            file_path = os.path.join(self.path, name) if os.path.isdir(self.path) else self.path
+            for entry in info["entries"]:
+                doc_id = json_util.loads(entry["id"])
+                sessions.append((_sort_key(doc_id), doc_id, file_path, entry))
+        sessions.sort(key=lambda session: session[0])
+        by_session = {}
+        for session in sessions:
+            # Like find_one, the first document of a session wins
+            by_session.setdefault(session[3]["sessionId"], session)
+        with self._lock:
+            self._sessions = sessions
+            self._keys = [session[0] for session in sessions]
+            self._by_session = by_session
+            self._cache.clear()
+
+    def _read_document(self, session_id):
+        session = self._by_session.get(session_id)
+        if session is None:
+            return None
+        _, _, file_path, entry = session
+        return _read_at(file_path, entry)
+
+    def _session_messages(self, session_id):
+        """(document, normalized messages, session index) of a session, from a small LRU."""
+        with self._lock:
+            cached = self._cache.get(session_id)
+            if cached is not None:
+                self._cache.move_to_end(session_id)
+                return cached
+        doc = self._read_document(session_id)
+        if doc is None:
+            return None
+        messages = normalize_messages(doc.get("messages") or [])
+        cached = (doc, messages, SessionIndex(messages))
+        with self._lock:
+            self._cache[session_id] = cached
+            while len(self._cache) > SESSION_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return cached
+
+    def load_session(self, session_id):
+        if not session_id:
+            return None
+        cached = self._session_messages(session_id)
+        return Session.from_document(cached[0]) if cached else None
+
+    def load_session_summary(self, session_id):
+        session = self.load_session(session_id)
+        if session is None:
+            return None
+        _, messages, _ = self._session_messages(session_id)
+        session.max_parallel_calls = max((len(message.tool_calls) for message in messages), default=0)
+        session.messages = []
+        return session
+
+    def load_message_page(self, session_id, roles, skip=0, limit=50, jump_to=None):
+        if not session_id:
+            return None
+        cached = self._session_messages(session_id)
+        if cached is None:
+            return None
+        _, messages, session_index = cached
+        return paginate_messages(messages, session_index, roles, skip=skip, limit=limit, jump_to=jump_to)
+
+    def list_sessions(self, agent_name=None, session_prefix=None, page_size=10, before_id=None, after_id=None):
+        """Same paging as session_store.list_sessions(), newest first by _id."""
+        def matches(session):
+            entry = session[3]
+            return ((not agent_name or entry["agentName"] == agent_name)
+                    and (not session_prefix or entry["sessionId"].startswith(session_prefix)))
+
+        sessions = self._sessions
+        if after_id is not None:
+            positions = range(bisect_right(self._keys, _sort_key(after_id)), len(sessions))
+        elif before_id is not None:
+            positions = range(bisect_left(self._keys, _sort_key(before_id)) - 1, -1, -1)
+        else:
+            positions = range(len(sessions) - 1, -1, -1)
+        candidates = (sessions[position] for position in positions)
+
+        docs = []
+        for session in candidates:
+            if matches(session):
+                entry = session[3]
+                docs.append({"_id": session[1], "sessionId": entry["sessionId"], "agentName": entry["agentName"]})
+                if len(docs) > page_size:
+                    break
+        has_more = len(docs) > page_size
+        docs = docs[:page_size]
+
+        if after_id is not None:
+            docs.reverse()
+            return SessionPage(docs, has_newer=has_more, has_older=True)
+        return SessionPage(docs, has_newer=before_id is not None, has_older=has_more)
+
+    def list_agent_names(self):
+        return sorted({session[3]["agentName"] for session in self._sessions if session[3]["agentName"]})
+
+    def iter_session_documents(self, agent_name=None, session_ids=None, min_id=None, max_id=None):
+        """Same selection as session_store.iter_session_documents(), read one document at a time."""
+        session_ids = set(session_ids) if session_ids else None
+        sessions = self._sessions
+        start = bisect_left(self._keys, _sort_key(min_id)) if min_id is not None else 0
+        end = bisect_right(self._keys, _sort_key(max_id)) if max_id is not None else len(sessions)
+        for _, _, file_path, entry in sessions[start:end]:
+            if agent_name and entry["agentName"] != agent_name:
+                continue
+            if session_ids is not None and entry["sessionId"] not in session_ids:
+                continue
+            yield _read_at(file_path, entry)
+
+    def count_session_errors(self, session_ids):
+        return {
+            session_id: self._by_session[session_id][3]["errors"]
+            for session_id in session_ids if session_id in self._by_session
+        }
+
+    def session_sizes(self, session_ids):
+        return {
+            session_id: self._by_session[session_id][3]["length"]
+            for session_id in session_ids if session_id in self._by_session
+        }
+
+    def load_rollups(self, agent_name=None):
+        """Rollups recorded in the index, so they are as current as the last refresh()."""
+        rollups = []
+        for _, doc_id, _, entry in self._sessions:
+            if agent_name and entry["agentName"] != agent_name:
+                continue
+            rollup = {key: value for key, value in entry.items() if key not in ("offset", "length", "id")}
+            rollup["_id"] = doc_id
+            rollups.append(rollup)
+        return rollups
+
+    def _search_indexes(self):
+        """(file path, entries, SearchIndex) per export file, built on first search and after the file changed."""
+        indexes = []
+        with self._search_lock:
+            search = {}
+            for name, info in self._files.items():
+                file_path = os.path.join(self.path, name) if os.path.isdir(self.path) else self.path
+                version = (info["size"], info["mtime"])
+                known = self._search.get(name)
+                if known is None or known[0] != version:
+                    logger.info("Building search index for %s", file_path)
+                    index = SearchIndex()
+                    for position, entry in enumerate(info["entries"]):
+                        doc = _read_at(file_path, entry)
+                        index.add(position, normalize_messages(doc.get("messages") or []))
+                    known = (version, index)
+                search[name] = known
+                indexes.append((file_path, info["entries"], known[1]))
+            self._search = search
+        return indexes
+
+    def search(self, query, agent_name=None, limit=SEARCH_LIMIT):
+        """Same results as session_store.search_sessions(), from in-memory inverted indexes."""
+        indexes = self._search_indexes()
+        hits = []
+        for position, document, score, message_ids in search_indexes([index for _, _, index in indexes], query):
+            _, file_entries, index = indexes[position]
+            entry = file_entries[index.documents[document]]
+            if agent_name and entry["agentName"] != agent_name:
+                continue
+            hits.append(SearchHit(entry["sessionId"], entry["agentName"], json_util.loads(entry["id"]),
+                                  score, message_ids))
+            if len(hits) >= limit:
+                break
+        return hits
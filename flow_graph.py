@@ -0,0 +1,583 @@
+"""Agent flow graph construction and the shared graph cache.
+
+Graphs are built once per session version at scale 1.0; the "Graph Scale" slider is
+applied by render_graph() on a copy, so every scale shares one cached graph.
+build_summary_graph() draws large sessions within a node budget by folding repeated
+tool call cycles and collapsing older turns, so their layout time stays bounded.
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import graphviz
+
+from message_model import ASSISTANT, SYSTEM, TOOL_CALL, TOOL_RESPONSE, USER, SessionIndex
+
+# Node and rank separation at scale 1.0
+NODESEP = 0.5
+RANKSEP = 0.4
+
+
+@contextmanager
+def _subgraph(parent, name=None):
+    """Context manager like parent.subgraph(), without copying the parent's body.
+
+    graphviz copies everything drawn so far into each subgraph it creates, which
+    made building a graph quadratic in the number of tool calls.
+    """
+    subgraph = graphviz.Digraph(name=name)
+    yield subgraph
+    parent.subgraph(subgraph)
+
+
+def new_graph():
+    # Create graph with improved styling
+    return graphviz.Digraph(
+        graph_attr={
+            "rankdir": "TB",
+            "splines": "polyline",
+            "nodesep": f"{NODESEP}",
+            "ranksep": f"{RANKSEP}",
+            "fontname": "Arial",
+            "bgcolor": "white"
+        },
+        node_attr={
+            "fontname": "Arial",
+            "fontsize": "11",
+            "margin": "0.2"
+        }
+    )
+
+
+class GraphBuilder:
+    """Builds the flow graph incrementally; add() appends messages in session order.
+
+    The session index must already contain the messages passed to add(). Tool nodes
+    whose next assistant message has not arrived yet are connected when it does.
+    """
+
+    def __init__(self, session_index):
+        self.graph = new_graph()
+        self.session_index = session_index
+        self.last_node = None  # Track the last node of any type
+        self._pending_tool_nodes = []
+
+    def add(self, messages):
+        graph = self.graph
+        session_index = self.session_index
+
+        for message in messages:
+            i = message.index
+            node_id = f"message_{i}"
+
+            # Handle error messages
+            if message.is_error:
+                error_node_id = node_id
+                graph.node(error_node_id,
+                          label=f"ERROR\nID: {i}\n{message.error_text[:50]}...",
+                          shape="hexagon",
+                          style="filled",
+                          fillcolor="#FFEBEE",
+                          color="#B71C1C")
+
+                # Connect error to the last node (whether it's a tool, assistant, or other)
+                if self.last_node:
+                    graph.edge(self.last_node, error_node_id)
+
+                # Update last_node to be this error node
+                self.last_node = error_node_id
+                continue
+
+            # Only create node for system messages and genuine user messages (not tool responses)
+            if message.kind in (SYSTEM, USER):
+                graph.node(node_id,
+                          label=f"{message.role.upper()}\nID: {i}",
+                          shape="rectangle",
+                          style="rounded,filled",
+                          fillcolor="#E3F2FD",
+                          color="#1565C0")
+                self.last_node = node_id
+
+            elif message.kind in (ASSISTANT, TOOL_CALL):
+                # Tool results that arrived before this assistant message continue into it
+                for tool_node_id in self._pending_tool_nodes:
+                    graph.edge(tool_node_id, node_id)
+                self._pending_tool_nodes = []
+
+                tool_calls_text = [f"Assistant\nID: {i}"]
+                for call_id, tool_name, _ in message.tool_calls:
+                    tool_calls_text.append(f"• {tool_name}")
+                label = "\n".join(tool_calls_text)
+
+                graph.node(node_id,
+                          label=label,
+                          shape="rectangle",
+                          style="rounded,filled",
+                          fillcolor="#FFF3E0",
+                          color="#E65100")
+
+                self.last_node = node_id
+
+                if message.tool_calls:
+                    with _subgraph(graph) as s:
+                        s.attr(rank='same')
+                        for y, (call_id, tool_name, _) in enumerate(message.tool_calls, start=1):
+                            call_id = call_id or 'unknown'
+                            tool_node_id = f"tool_{call_id}"
+                            s.node(tool_node_id,
+                                  label=f"{tool_name}\nID: {i+y}",
+                                  shape="hexagon",
+                                  style="filled",
+                                  fillcolor="#F3E5F5",
+                                  color="#6A1B9A")
+                            graph.edge(node_id, tool_node_id)
+                            self.last_node = tool_node_id  # Update last_node to this tool node
+
+            elif message.kind == TOOL_RESPONSE:
+                for link in session_index.response_links(message):
+                    tool_node_id = f"tool_{link.call_id or 'unknown'}"
+                    self.last_node = tool_node_id  # Update last_node to this tool node
+                    next_assistant_id = session_index.next_assistant(link.call_index)
+                    if next_assistant_id:
+                        graph.edge(tool_node_id, f"message_{next_assistant_id}")
+                    else:
+                        self._pending_tool_nodes.append(tool_node_id)
+
+
+def build_graph(messages, session_index=None):
+    """Build the flow graph for a session's normalized messages at scale 1.0."""
+    builder = GraphBuilder(session_index if session_index is not None else SessionIndex(messages))
+    builder.add(messages)
+    return builder.graph
+
+
+def render_graph(graph, scale=1.0):
+    """Copy of a cached graph with node/rank separation scaled for display."""
+    scaled = graph.copy()
+    scaled.graph_attr = dict(graph.graph_attr, nodesep=f"{NODESEP * scale}", ranksep=f"{RANKSEP * scale}")
+    return scaled
+
+
+def graph_size(graph):
+    """Approximate memory held by a graph, based on the length of its DOT statements."""
+    return sum(len(line) for line in graph.body) * 2 + 1024
+
+
+class GraphCache:
+    """Thread-safe LRU of built graphs, bounded by an approximate byte budget.
+
+    Keys should identify a session version, e.g. (database, sessionId, fingerprint).
+    Values other than graphs need a ``sizer`` that estimates their size. get_or_build()
+    builds each key once at a time: other threads asking for it wait for that build,
+    e.g. a click on a session that is being prefetched.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._building = {}  # key -> Event set when its build finishes
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, graph, sizer=graph_size):
+        size = sizer(graph)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            # Graphs larger than the whole budget are returned but never stored
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (graph, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_build(self, key, build, sizer=graph_size):
+        graph = self.get(key)
+        if graph is not None:
+            return graph
+        with self._lock:
+            building = self._building.get(key)
+            if building is None:
+                self._building[key] = threading.Event()
+        if building is not None:
+            building.wait()
+            graph = self.get(key)
+            if graph is not None:
+                return graph
+            # The other build failed, or its graph was too large to keep
+            graph = build()
+            self.put(key, graph, sizer)
+            return graph
+        try:
+            graph = build()
+            self.put(key, graph, sizer)
+            return graph
+        finally:
+            with self._lock:
+                self._building.pop(key).set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Summary mode: steps repeating with a period of up to this many steps are folded
+MAX_FOLD_PERIOD = 3
+# A pattern has to repeat at least this often to be folded
+MIN_FOLD_REPEATS = 2
+DEFAULT_NODE_BUDGET = 150
+# The "Auto" graph mode switches to the summary graph above this many messages
+SUMMARY_GRAPH_THRESHOLD = 300
+# Ranges of collapsed turns open into this many smaller ranges when expanded
+RANGE_SPLIT = 10
+
+
+class SummaryGraph:
+    """Summarized flow graph plus the folded nodes that can be expanded.
+
+    ``folds`` maps the id of every fold and collapsed turn to its description,
+    including the ones currently expanded, so they can be collapsed again.
+    """
+
+    __slots__ = ("graph", "folds")
+
+    def __init__(self, graph, folds):
+        self.graph = graph
+        self.folds = folds
+
+
+class _Unit:
+    """One block of the summary graph: a message, a tool call step or a fold of steps."""
+
+    __slots__ = ("kind", "messages", "pattern", "repeats")
+
+    def __init__(self, kind, messages, pattern=None, repeats=1):
+        self.kind = kind          # "message", "step" or "fold"
+        self.messages = messages  # Messages covered, in session order
+        self.pattern = pattern    # Tool names per step of the repeated cycle, for folds
+        self.repeats = repeats
+
+    @property
+    def node_id(self):
+        return f"fold_{self.messages[0].index}" if self.kind == "fold" else f"message_{self.messages[0].index}"
+
+    @property
+    def node_count(self):
+        if self.kind == "step":
+            return 1 + len(self.messages[0].tool_calls)
+        return 1
+
+
+def _fold_label(pattern, repeats, messages):
+    cycle = " → ".join(" + ".join(names) for names in pattern)
+    return f"{cycle}\n×{repeats}\nIDs {messages[0].index}–{messages[-1].index}"
+
+
+def _find_cycle(names, start):
+    """Longest run of a repeated cycle of tool steps at ``start``: (period, repeats) or None."""
+    best = None
+    for period in range(1, MAX_FOLD_PERIOD + 1):
+        pattern = names[start:start + period]
+        if len(pattern) < period:
+            break
+        repeats = 1
+        while names[start + repeats * period:start + (repeats + 1) * period] == pattern:
+            repeats += 1
+        if repeats >= MIN_FOLD_REPEATS and (best is None or period * repeats > best[0] * best[1]):
+            best = (period, repeats)
+    return best
+
+
+def _fold_steps(steps):
+    """Fold consecutive step units whose tool calls repeat into fold units."""
+    names = [step.messages[0].tool_names for step in steps]
+    units = []
+    i = 0
+    while i < len(steps):
+        cycle = _find_cycle(names, i)
+        if cycle is None:
+            units.append(steps[i])
+            i += 1
+            continue
+        period, repeats = cycle
+        end = i + period * repeats
+        folded = [message for step in steps[i:end] for message in step.messages]
+        units.append(_Unit("fold", folded, pattern=names[i:i + period], repeats=repeats))
+        i = end
+    return units
+
+
+def _session_turns(messages):
+    """Group messages into units per user turn, folding repeated tool call cycles."""
+    turns = [[]]
+    steps = []
+
+    def flush_steps():
+        turns[-1].extend(_fold_steps(steps))
+        steps.clear()
+
+    for message in messages:
+        if message.kind == TOOL_CALL:
+            steps.append(_Unit("step", [message]))
+            continue
+        if message.kind == TOOL_RESPONSE and not message.is_error:
+            # Responses are drawn as the edges leaving their tool nodes
+            continue
+        if not message.is_error and message.kind not in (SYSTEM, USER, ASSISTANT):
+            continue
+        flush_steps()
+        if message.kind == USER and any(u.kind == "message" and u.messages[0].kind == USER for u in turns[-1]):
+            turns.append([])
+        turns[-1].append(_Unit("message", [message]))
+    flush_steps()
+    return [turn for turn in turns if turn]
+
+
+def _expand(units, expanded):
+    result = []
+    for unit in units:
+        if unit.kind == "fold" and unit.node_id in expanded:
+            result.extend(_Unit("step", [message]) for message in unit.messages)
+        else:
+            result.append(unit)
+    return result
+
+
+def _turn_summary(number, units):
+    messages = [message for unit in units for message in unit.messages]
+    tool_counts = {}
+    for message in messages:
+        for name in message.tool_names:
+            tool_counts[name] = tool_counts.get(name, 0) + 1
+    steps = sum(1 for message in messages if message.kind == TOOL_CALL)
+    errors = sum(1 for message in messages if message.is_error)
+    top_tools = sorted(tool_counts.items(), key=lambda item: -item[1])[:3]
+    lines = [number, f"{steps} tool steps, {errors} errors", f"IDs {messages[0].index}–{messages[-1].index}"]
+    lines.extend(f"{name} ×{count}" for name, count in top_tools)
+    return "\n".join(lines)
+
+
+def _add_unit(graph, unit):
+    """Draw a unit; returns the node ids its outgoing edges start from."""
+    message = unit.messages[0]
+    node_id = unit.node_id
+    if unit.kind == "fold":
+        graph.node(node_id,
+                   label=_fold_label(unit.pattern, unit.repeats, unit.messages),
+                   shape="box3d",
+                   style="filled",
+                   fillcolor="#F3E5F5",
+                   color="#6A1B9A")
+        return [node_id]
+    if message.is_error:
+        graph.node(node_id,
+                   label=f"ERROR\nID: {message.index}\n{message.error_text[:50]}...",
+                   shape="hexagon",
+                   style="filled",
+                   fillcolor="#FFEBEE",
+                   color="#B71C1C")
+        return [node_id]
+    if message.kind in (SYSTEM, USER):
+        graph.node(node_id,
+                   label=f"{message.role.upper()}\nID: {message.index}",
+                   shape="rectangle",
+                   style="rounded,filled",
+                   fillcolor="#E3F2FD",
+                   color="#1565C0")
+        return [node_id]
+
+    label = "\n".join([f"Assistant\nID: {message.index}"] + [f"• {name}" for name in message.tool_names])
+    graph.node(node_id,
+               label=label,
+               shape="rectangle",
+               style="rounded,filled",
+               fillcolor="#FFF3E0",
+               color="#E65100")
+    if not message.tool_calls:
+        return [node_id]
+
+    tool_node_ids = []
+    with _subgraph(graph) as s:
+        s.attr(rank="same")
+        for y, (call_id, tool_name, _) in enumerate(message.tool_calls, start=1):
+            tool_node_id = f"tool_{call_id or 'unknown'}"
+            s.node(tool_node_id,
+                   label=f"{tool_name}\nID: {message.index + y}",
+                   shape="hexagon",
+                   style="filled",
+                   fillcolor="#F3E5F5",
+                   color="#6A1B9A")
+            graph.edge(node_id, tool_node_id)
+            tool_node_ids.append(tool_node_id)
+    return tool_node_ids
+
+
+def _range_id(first, last):
+    return f"turn_{first}" if first == last else f"turns_{first}_{last}"
+
+
+def _turn_ranges(numbers, excess):
+    """(first, last) runs of consecutive collapsed turn numbers, merging the oldest to save ``excess`` nodes."""
+    ranges = []
+    for number in numbers:
+        if excess > 0 and ranges and ranges[-1][1] == number - 1:
+            ranges[-1] = (ranges[-1][0], number)
+            excess -= 1
+        else:
+            ranges.append((number, number))
+    return ranges
+
+
+def _range_pieces(first, last):
+    size = -(-(last - first + 1) // RANGE_SPLIT)
+    return [(start, min(start + size - 1, last)) for start in range(first, last + 1, size)]
+
+
+def _range_tree(ranges, expanded):
+    """Every range reached from ``ranges`` by opening the expanded ones, outermost first."""
+    result = []
+    pending = list(ranges)
+    while pending:
+        first, last = pending.pop(0)
+        result.append((first, last))
+        if first != last and _range_id(first, last) in expanded:
+            pending.extend(_range_pieces(first, last))
+    return result
+
+
+def _split_range(first, last, expanded):
+    """The ranges drawn for a merged range: expanded ones open into up to RANGE_SPLIT smaller ranges."""
+    if first == last or _range_id(first, last) not in expanded:
+        return [(first, last)]
+    return [piece for start, end in _range_pieces(first, last) for piece in _split_range(start, end, expanded)]
+
+
+def build_summary_graph(messages, node_budget=DEFAULT_NODE_BUDGET, expanded=()):
+    """Build a summarized flow graph with at most about ``node_budget`` nodes.
+
+    Consecutive tool call steps that repeat the same tools (with a cycle of up to
+    MAX_FOLD_PERIOD steps) are folded into one counted node, and each user turn is
+    drawn as a cluster. While the graph is over budget the oldest turns are collapsed
+    into a single node each, then runs of collapsed turns are merged into range nodes
+    ("Turns 1–1850"), then the start of the last turn is summarized. Folds and turns
+    whose id is in ``expanded`` are drawn in full; expanded ranges open into up to
+    RANGE_SPLIT smaller ranges.
+    """
+    expanded = set(expanded)
+    turns = _session_turns(messages)
+    fold_labels = {}
+    for turn in turns:
+        for unit in turn:
+            if unit.kind == "fold":
+                fold_labels[unit.node_id] = _fold_label(unit.pattern, unit.repeats, unit.messages).replace("\n", " ")
+    turns = [_expand(turn, expanded) for turn in turns]
+
+    # Decide which turns are collapsed, oldest first, until the graph fits the budget
+    collapsed = [False] * len(turns)
+    sizes = [sum(unit.node_count for unit in turn) for turn in turns]
+    total = sum(sizes)
+    for number, turn in enumerate(turns[:-1], start=1):
+        if total <= node_budget:
+            break
+        if f"turn_{number}" not in expanded:
+            collapsed[number - 1] = True
+            total -= sizes[number - 1] - 1
+
+    # With many turns one node per collapsed turn is still too much: merge runs of them, oldest first
+    collapsed_numbers = [number for number, is_collapsed in enumerate(collapsed, start=1) if is_collapsed]
+    ranges = _turn_ranges(collapsed_numbers, total - node_budget)
+    drawn_ranges = [piece for first, last in ranges for piece in _split_range(first, last, expanded)]
+    total += len(drawn_ranges) - len(collapsed_numbers)
+
+    # The last turn keeps its most recent units and summarizes the rest in one node
+    head = []
+    if turns and total > node_budget:
+        last = turns[-1]
+        rest = total - sizes[-1] + 1
+        cut = len(last) - 1
+        kept_size = last[-1].node_count
+        while cut > 1 and rest + kept_size + last[cut - 1].node_count <= node_budget:
+            cut -= 1
+            kept_size += last[cut].node_count
+        head, turns[-1] = last[:cut], last[cut:]
+
+    def range_units(first, last):
+        return [unit for turn in turns[first - 1:last] for unit in turn]
+
+    def range_title(first, last):
+        return f"Turn {first}" if first == last else f"Turns {first}–{last}"
+
+    def range_label(first, last):
+        units = range_units(first, last)
+        return f"{range_title(first, last)} (IDs {units[0].messages[0].index}–{units[-1].messages[-1].index})"
+
+    # Offer the folds that are drawn, the turns and ranges that are collapsed and whatever is expanded
+    visible = {unit.node_id for turn, is_collapsed in zip(turns, collapsed) if not is_collapsed for unit in turn}
+    folds = OrderedDict()
+    offered = [(first, last) for first, last in _range_tree(ranges, expanded) if _range_id(first, last) in expanded]
+    offered += drawn_ranges
+    offered += [(number, number) for number in range(1, len(turns) + 1) if f"turn_{number}" in expanded]
+    for first, last in sorted(set(offered), key=lambda pair: (pair[0], -pair[1])):
+        folds[_range_id(first, last)] = range_label(first, last)
+    for node_id, label in fold_labels.items():
+        if node_id in visible or node_id in expanded:
+            folds[node_id] = label
+
+    graph = new_graph()
+    exits = []
+
+    def connect(node_id, tails):
+        for tail in tails:
+            graph.edge(tail, node_id)
+
+    blocks = [(first, last) for first, last in drawn_ranges]
+    blocks += [(number, None) for number, is_collapsed in enumerate(collapsed, start=1) if not is_collapsed]
+    for first, last in sorted(blocks):
+        if last is not None:
+            node_id = _range_id(first, last)
+            graph.node(node_id, label=_turn_summary(range_title(first, last), range_units(first, last)),
+                       shape="folder", style="filled", fillcolor="#ECEFF1", color="#455A64")
+            connect(node_id, exits)
+            exits = [node_id]
+            continue
+
+        number, turn = first, turns[first - 1]
+        title = f"Turn {number}"
+        with _subgraph(graph, name=f"cluster_turn_{number}") as cluster:
+            cluster.attr(label=title, style="rounded,dashed", color="#90A4AE", fontname="Arial")
+            if head and number == len(turns):
+                node_id = f"turn_{number}_head"
+                cluster.node(node_id, label=_turn_summary(f"{title} (earlier)", head), shape="folder",
+                             style="filled", fillcolor="#ECEFF1", color="#455A64")
+                connect(node_id, exits)
+                exits = [node_id]
+            for unit in turn:
+                entry = unit.node_id
+                tails = _add_unit(cluster, unit)
+                connect(entry, exits)
+                exits = tails
+    return SummaryGraph(graph, folds)
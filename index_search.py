@@ -0,0 +1,60 @@
+"""Fill the MongoDB message search index, outside the dashboard.
+
+    python index_search.py --database snaplogic              # index what was added since the last run
+    python index_search.py --database snaplogic --every 60   # keep indexing, e.g. as a sidecar
+
+The dashboard's message search only runs a $text query on the LogSearch collection;
+this script fills it with session_store.update_search_index(). The first run indexes
+every message of the Log collection, later runs only new documents and the messages
+appended to sessions that were still running. Run it from cron or with --every;
+sessions are searchable once it has indexed them.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from session_store import ensure_search_indexes, update_search_index
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="MongoDB database holding the Log collection")
+    parser.add_argument("--uri", help="MongoDB connection string, default $MONGO_URI")
+    parser.add_argument("--every", type=float, help="keep running, indexing new messages every this many seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    load_dotenv()
+    uri = args.uri or os.getenv("MONGO_URI")
+    if not uri:
+        raise SystemExit("Set MONGO_URI or pass --uri")
+    collection = MongoClient(uri).get_database(args.database).get_collection("Log")
+    ensure_search_indexes(collection)
+
+    while True:
+        started = time.perf_counter()
+        try:
+            processed = update_search_index(collection)
+        except PyMongoError as exc:
+            if not args.every:
+                raise
+            # Keep the service running through failovers and network errors
+            logger.warning("Indexing %s failed: %s", collection.full_name, exc)
+        else:
+            logger.info("Indexed %s sessions of %s in %.1fs", processed, collection.full_name,
+                        time.perf_counter() - started)
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
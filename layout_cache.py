@@ -0,0 +1,243 @@
+"""Pre-rendered graph layouts of finished sessions, shared by every dashboard replica.
+
+st.graphviz_chart() sends the DOT source to the browser, which lays the graph out
+again on every display. Sessions that are no longer running never change (is_finished()
+goes by their age and whether they were seen growing), so their graphs are laid out
+once on the server (Graphviz ``dot`` to SVG) and stored in a side collection next to
+the Log collection (MongoLayoutCache) or in a directory (DiskLayoutCache). Entries are
+keyed by session fingerprint, graph variant and scale, so a session that grows simply
+gets a new entry. pan_zoom_html() shows the SVG with drag to pan, wheel to zoom and
+double click to reset.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+import graphviz
+from bson import Binary, ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+
+from atomic_files import atomic_write
+from session_store import ROLLUP_OPEN_WINDOW
+
+logger = logging.getLogger(__name__)
+
+LAYOUT_COLLECTION = "LogLayout"
+# Layouts not rendered again for this long are dropped by a TTL index
+LAYOUT_TTL = timedelta(days=30)
+# Compressed layouts above this are not stored (MongoDB documents are limited to 16 MB)
+MAX_LAYOUT_BYTES = 15 * 1024 * 1024
+# A session seen growing is laid out on the server again once it has not changed for this long
+SETTLE_TIME = timedelta(minutes=10)
+# Sessions whose last fingerprint is remembered per process
+MAX_TRACKED_SESSIONS = 10000
+
+
+@dataclass
+class Layout:
+    svg: str
+    folds: dict = field(default_factory=dict)  # summary graph folds, so they can be expanded without a rebuild
+
+
+def layout_key(source, session_id, fingerprint, variant, scale):
+    """Cache key of a session version drawn as ``variant`` (graph mode and its options) at ``scale``."""
+    text = json.dumps([list(source), session_id, fingerprint, list(variant), round(scale, 2)], default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class GrowthTracker:
+    """Fingerprint each session had when it was last checked, to tell growing sessions from finished ones."""
+
+    def __init__(self, settle_time=SETTLE_TIME, max_sessions=MAX_TRACKED_SESSIONS, clock=time.monotonic):
+        self.settle_seconds = settle_time.total_seconds()
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._seen = OrderedDict()  # doc_id -> (fingerprint, when it changed, None if never seen changing)
+        self._lock = threading.Lock()
+
+    def settled(self, doc_id, fingerprint):
+        """Whether the session has not changed in the last ``settle_time``, or since it was first checked."""
+        now = self.clock()
+        with self._lock:
+            previous = self._seen.pop(doc_id, None)
+            if previous is None:
+                changed_at = None
+            elif previous[0] == fingerprint:
+                changed_at = previous[1]
+            else:
+                changed_at = now
+            self._seen[doc_id] = (fingerprint, changed_at)
+            while len(self._seen) > self.max_sessions:
+                self._seen.popitem(last=False)
+        return changed_at is None or now - changed_at >= self.settle_seconds
+
+
+SESSION_GROWTH = GrowthTracker()
+
+
+def is_finished(session, tracker=SESSION_GROWTH):
+    """Whether a session is done: created over ROLLUP_OPEN_WINDOW ago and not seen growing lately.
+
+    Age alone would let a long-running session through, laying it out again and storing
+    a new layout on every view. Documents without an ObjectId come from static exports.
+    """
+    if not isinstance(session.doc_id, ObjectId):
+        return True
+    # Checked for young sessions too, so a session that was seen growing has to settle first
+    settled = tracker.settled(session.doc_id, session.fingerprint)
+    return settled and session.doc_id.generation_time < datetime.now(timezone.utc) - ROLLUP_OPEN_WINDOW
+
+
+def dot_available():
+    try:
+        graphviz.version()
+    except graphviz.ExecutableNotFound:
+        return False
+    return True
+
+
+def render_layout(graph, folds=None):
+    """Lay a graph out with the local Graphviz. Raises graphviz.ExecutableNotFound or CalledProcessError."""
+    return Layout(graph.pipe(format="svg", encoding="utf-8"), dict(folds or {}))
+
+
+def _encode(layout):
+    return json.dumps({"svg": layout.svg, "folds": layout.folds}).encode("utf-8")
+
+
+def _decode(data):
+    entry = json.loads(data)
+    return Layout(entry["svg"], entry.get("folds") or {})
+
+
+class MongoLayoutCache:
+    """Layouts in a collection of the session's database, compressed."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        try:
+            collection.create_index("createdAt", expireAfterSeconds=int(LAYOUT_TTL.total_seconds()))
+        except OperationFailure as exc:
+            logger.warning("Could not ensure the TTL index on %s: %s", collection.full_name, exc)
+
+    def get(self, key):
+        try:
+            doc = self.collection.find_one({"_id": key}, {"layout": 1})
+        except PyMongoError as exc:
+            logger.warning("Could not read layout from %s: %s", self.collection.full_name, exc)
+            return None
+        return _decode(zlib.decompress(doc["layout"])) if doc else None
+
+    def put(self, key, layout):
+        data = zlib.compress(_encode(layout))
+        if len(data) > MAX_LAYOUT_BYTES:
+            return
+        try:
+            self.collection.replace_one(
+                {"_id": key}, {"layout": Binary(data), "createdAt": datetime.now(timezone.utc)}, upsert=True)
+        except PyMongoError as exc:
+            # Read-only users still get the layout, it just isn't shared
+            logger.warning("Could not store layout in %s: %s", self.collection.full_name, exc)
+
+
+class DiskLayoutCache:
+    """Layouts as gzip files in a directory, e.g. a volume mounted into every replica."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, key):
+        try:
+            with gzip.open(self._path(key), "rb") as f:
+                return _decode(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.warning("Ignoring unreadable layout %s: %s", self._path(key), exc)
+            return None
+
+    def put(self, key, layout):
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Other replicas never read half a layout
+            with atomic_write(path, "wb") as f:
+                f.write(gzip.compress(_encode(layout)))
+        except OSError as exc:
+            logger.warning("Could not store layout %s: %s", path, exc)
+
+
+_VIEWER_HTML = """
+<div id="viewer" style="width: 100%; height: __HEIGHT__px; overflow: hidden; cursor: grab; touch-action: none;">
+__SVG__
+</div>
+<script>
+const box = document.getElementById("viewer");
+const svg = box.querySelector("svg");
+svg.removeAttribute("width");
+svg.removeAttribute("height");
+svg.style.width = "100%";
+svg.style.height = "100%";
+const base = svg.viewBox.baseVal;
+const home = {x: base.x, y: base.y, w: base.width, h: base.height};
+let view = {...home};
+let drag = null;
+
+function apply() {
+    svg.setAttribute("viewBox", `${view.x} ${view.y} ${view.w} ${view.h}`);
+}
+// Graph units per screen pixel; the viewBox is fitted into the box keeping its aspect ratio
+function unitsPerPixel() {
+    const rect = box.getBoundingClientRect();
+    return Math.max(view.w / rect.width, view.h / rect.height);
+}
+box.addEventListener("wheel", event => {
+    event.preventDefault();
+    const rect = box.getBoundingClientRect();
+    const factor = event.deltaY > 0 ? 1.2 : 1 / 1.2;
+    const units = unitsPerPixel();
+    // Keep the point under the cursor in place
+    const x = view.x + view.w / 2 + (event.clientX - rect.left - rect.width / 2) * units;
+    const y = view.y + view.h / 2 + (event.clientY - rect.top - rect.height / 2) * units;
+    view = {x: x - (x - view.x) * factor, y: y - (y - view.y) * factor, w: view.w * factor, h: view.h * factor};
+    apply();
+}, {passive: false});
+box.addEventListener("pointerdown", event => {
+    drag = {x: event.clientX, y: event.clientY, viewX: view.x, viewY: view.y, units: unitsPerPixel()};
+    box.setPointerCapture(event.pointerId);
+    box.style.cursor = "grabbing";
+});
+box.addEventListener("pointermove", event => {
+    if (!drag) return;
+    view.x = drag.viewX - (event.clientX - drag.x) * drag.units;
+    view.y = drag.viewY - (event.clientY - drag.y) * drag.units;
+    apply();
+});
+box.addEventListener("pointerup", () => {
+    drag = null;
+    box.style.cursor = "grab";
+});
+box.addEventListener("dblclick", () => {
+    view = {...home};
+    apply();
+});
+</script>
+"""
+
+
+def pan_zoom_html(svg, height):
+    """HTML showing an SVG with pan and zoom, for streamlit.components.v1.html()."""
+    # Drop the XML declaration and doctype that Graphviz writes before the <svg> element
+    svg = svg[svg.find("<svg"):]
+    return _VIEWER_HTML.replace("__HEIGHT__", str(height)).replace("__SVG__", svg)
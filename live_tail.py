@@ -0,0 +1,132 @@
+"""Live tail of an in-flight agent session.
+
+SessionTail holds the normalized messages, SessionIndex and flow graph of one session
+and only appends the messages added since the last check. New messages are noticed
+through a change stream when the server has one (replica sets, Atlas); otherwise the
+document is polled, backing off exponentially while the session is idle.
+
+Log documents are treated as append-only: messages are only ever pushed to the end.
+Pass use_change_stream=False to always poll, e.g. against mongomock in tests.
+"""
+import logging
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from flow_graph import GraphBuilder
+from message_model import SessionIndex, normalize_message
+
+logger = logging.getLogger(__name__)
+
+# Messages fetched per round trip when catching up
+TAIL_BATCH_SIZE = 1000
+# How long the server may hold a change stream getMore open; poll() runs on the script thread
+STREAM_MAX_AWAIT_MS = 100
+
+
+class SessionTail:
+    def __init__(self, collection, session_id, interval=2.0, max_interval=30.0, use_change_stream=True,
+                 clock=time.monotonic):
+        self.collection = collection
+        self.session_id = session_id
+        self.interval = interval
+        self.max_interval = max_interval
+        self.messages = []
+        self.session_index = SessionIndex()
+        self.graph_builder = GraphBuilder(self.session_index)
+        self.max_parallel_calls = 0
+        self.doc_id = None
+        self.idle_polls = 0
+        self._raw_count = 0
+        self._clock = clock
+        self._next_poll = 0.0
+        self._stream = None
+
+        if use_change_stream:
+            # The stream is opened before the first read, so appends landing in between are read rather than lost
+            doc = collection.find_one({"sessionId": session_id}, {"_id": 1})
+            if doc is not None:
+                self.doc_id = doc["_id"]
+                self._open_stream()
+        self._fetch_new()
+        self._next_poll = clock() + interval
+
+    @property
+    def graph(self):
+        return self.graph_builder.graph
+
+    @property
+    def uses_change_stream(self):
+        return self._stream is not None
+
+    @property
+    def current_interval(self):
+        """Delay before the next poll, growing while no new messages arrive."""
+        return min(self.interval * 2 ** self.idle_polls, self.max_interval)
+
+    def _open_stream(self):
+        try:
+            self._stream = self.collection.watch([{"$match": {"documentKey._id": self.doc_id}}],
+                                                 max_await_time_ms=STREAM_MAX_AWAIT_MS)
+        except OperationFailure as exc:
+            # Standalone servers have no change streams
+            logger.info("Change streams unavailable, polling %s instead: %s", self.session_id, exc)
+            self._stream = None
+
+    def _stream_changed(self):
+        changed = False
+        try:
+            while self._stream.try_next() is not None:
+                changed = True
+        except PyMongoError as exc:
+            logger.warning("Change stream for %s failed, falling back to polling: %s", self.session_id, exc)
+            self.close()
+            return True
+        return changed
+
+    def _fetch_new(self):
+        added = []
+        while True:
+            doc = self.collection.find_one(
+                {"sessionId": self.session_id},
+                {"sessionId": 1, "messages": {"$slice": [self._raw_count, TAIL_BATCH_SIZE]}},
+            )
+            if doc is None:
+                break
+            self.doc_id = doc["_id"]
+            batch = doc.get("messages") or []
+            for offset, raw in enumerate(batch):
+                if isinstance(raw, dict):
+                    added.append(normalize_message(self._raw_count + offset + 1, raw))
+            self._raw_count += len(batch)
+            if len(batch) < TAIL_BATCH_SIZE:
+                break
+
+        if added:
+            self.messages.extend(added)
+            self.session_index.extend(added)
+            self.graph_builder.add(added)
+            self.max_parallel_calls = max(self.max_parallel_calls, max(len(m.tool_calls) for m in added))
+        return len(added)
+
+    def poll(self):
+        """Fetch messages added since the last call. Returns how many were appended."""
+        if self._stream is not None:
+            if not self._stream_changed():
+                return 0
+            return self._fetch_new()
+
+        now = self._clock()
+        if now < self._next_poll:
+            return 0
+        added = self._fetch_new()
+        self.idle_polls = 0 if added else self.idle_polls + 1
+        self._next_poll = now + self.current_interval
+        return added
+
+    def close(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            finally:
+                self._stream = None
@@ -0,0 +1,188 @@
+"""Normalized view of the raw messages stored in a Log document.
+
+Messages come in two shapes: OpenAI style (``tool_calls`` on the assistant message,
+``function_id``/``tool_call_id`` on the tool message) and Bedrock style (``toolUse``
+and ``toolResult`` blocks inside ``content``). normalize_messages() parses every raw
+message once into a Message record that the graph, filter and history views share,
+without writing anything back into the raw dicts. SessionIndex links tool calls to
+their responses so the views don't have to search the message list for them.
+"""
+from bisect import bisect_right
+
+# Message kinds
+SYSTEM = "system"
+USER = "user"
+ASSISTANT = "assistant"
+TOOL_CALL = "tool_call"
+TOOL_RESPONSE = "tool_response"
+ERROR = "error"
+OTHER = "other"
+
+# Roles offered by the "Filter by Role" control
+FILTER_ROLES = ["system", "user", "assistant", "tool", "error"]
+
+# Filter roles each kind shows up under; assistant tool calls are listed under "tool" too
+KIND_FILTER_ROLES = {
+    SYSTEM: ("system",),
+    USER: ("user",),
+    ASSISTANT: ("assistant",),
+    TOOL_CALL: ("assistant", "tool"),
+    TOOL_RESPONSE: ("tool",),
+    ERROR: ("error",),
+    OTHER: (),
+}
+
+
+class Message:
+    __slots__ = ("index", "kind", "role", "tool_calls", "response_ids", "is_error", "error_text", "raw")
+
+    def __init__(self, index, kind, role, tool_calls=(), response_ids=(), is_error=False, error_text=None, raw=None):
+        self.index = index                # 1-based position in the session's messages array
+        self.kind = kind
+        self.role = role                  # role label shown in the UI
+        self.tool_calls = tool_calls      # ((call_id, name, arguments), ...) for TOOL_CALL
+        self.response_ids = response_ids  # call ids answered by a TOOL_RESPONSE
+        self.is_error = is_error
+        self.error_text = error_text
+        self.raw = raw                    # the untouched message dict
+
+    def __repr__(self):
+        return f"Message({self.index}, {self.kind!r}, {self.role!r})"
+
+    @property
+    def tool_names(self):
+        return tuple(call[1] for call in self.tool_calls)
+
+    @property
+    def filter_roles(self):
+        roles = KIND_FILTER_ROLES[self.kind]
+        # Failed tool results are both tool responses and errors
+        if self.is_error and self.kind != ERROR:
+            roles = roles + ("error",)
+        return roles
+
+    def matches_roles(self, roles):
+        return any(role in roles for role in self.filter_roles)
+
+
+def _content_blocks(content, key):
+    if not isinstance(content, list):
+        return []
+    return [block[key] for block in content if isinstance(block, dict) and block.get(key)]
+
+
+def normalize_message(index, message):
+    """Parse one raw message dict into a Message."""
+    sl_role = message.get("sl_role") or ""
+    raw_role = message.get("role") or ""
+    content = message.get("content")
+    role = sl_role or raw_role
+    role_lower = role.lower()
+
+    tool_calls = []
+    for call in message.get("tool_calls") or []:
+        function = call.get("function") or {}
+        tool_calls.append((call.get("id"), function.get("name", "Unknown"), function.get("arguments", "N/A")))
+    for tool_use in _content_blocks(content, "toolUse"):
+        tool_calls.append((tool_use.get("toolUseId"), tool_use.get("name", "Unknown"), tool_use.get("input", {})))
+    tool_results = _content_blocks(content, "toolResult")
+
+    if role_lower == "error" or raw_role.lower() == "error":
+        return Message(index, ERROR, role, is_error=True,
+                       error_text=str(message.get("content", "Unknown error")), raw=message)
+
+    if role_lower.startswith("assistant"):
+        if tool_calls:
+            return Message(index, TOOL_CALL, sl_role or "assistant (tool call)", tuple(tool_calls), raw=message)
+        return Message(index, ASSISTANT, role, raw=message)
+
+    if tool_results:
+        response_ids = tuple(result.get("toolUseId", "") for result in tool_results)
+        errors = [result["error"] for result in tool_results if result.get("error")]
+        return Message(index, TOOL_RESPONSE, sl_role or "tool (response)", response_ids=response_ids,
+                       is_error=bool(errors), error_text=str(errors[0]) if errors else None, raw=message)
+
+    if role_lower.startswith("tool"):
+        call_id = message.get("function_id") or message.get("tool_call_id")
+        return Message(index, TOOL_RESPONSE, role, response_ids=(call_id,) if call_id else (), raw=message)
+
+    if role_lower == "system":
+        return Message(index, SYSTEM, role, raw=message)
+    if role_lower == "user":
+        return Message(index, USER, role, raw=message)
+    return Message(index, OTHER, role or "Output", raw=message)
+
+
+def normalize_messages(history):
+    """Normalize a session's messages; non-dict entries are skipped but keep their position."""
+    return [normalize_message(i + 1, message) for i, message in enumerate(history) if isinstance(message, dict)]
+
+
+def filter_messages(messages, roles):
+    roles = {role.lower() for role in roles}
+    return [message for message in messages if message.matches_roles(roles)]
+
+
+class ToolLink:
+    __slots__ = ("call_id", "name", "call_index", "response_index")
+
+    def __init__(self, call_id, name, call_index, response_index=None):
+        self.call_id = call_id
+        self.name = name
+        self.call_index = call_index          # index of the message holding the tool call
+        # Index of the first message answering it, None while unknown; only set on full indexes, not from_calls()
+        self.response_index = response_index
+
+
+class SessionIndex:
+    """Per-session lookups built in one pass over the normalized messages.
+
+    from_calls() builds a partial index from a tool call directory, for when only
+    a page of the session was fetched.
+    """
+
+    def __init__(self, messages=()):
+        self.links = {}
+        self._assistant_positions = []
+        self.extend(messages)
+
+    def extend(self, messages):
+        """Add messages that come after the ones already indexed."""
+        for message in messages:
+            if message.kind in (ASSISTANT, TOOL_CALL):
+                self._assistant_positions.append(message.index)
+            for call_id, tool_name, _ in message.tool_calls:
+                self.add_call(call_id, tool_name, message.index)
+            for call_id in message.response_ids:
+                link = self.links.get(call_id)
+                if link is not None and link.response_index is None:
+                    link.response_index = message.index
+
+    @classmethod
+    def from_calls(cls, calls):
+        """Index built from (call_index, call_id, tool_name) tuples."""
+        index = cls()
+        for call_index, call_id, tool_name in calls:
+            index.add_call(call_id, tool_name, call_index)
+        return index
+
+    def add_call(self, call_id, tool_name, call_index):
+        self.links[call_id] = ToolLink(call_id, tool_name, call_index)
+
+    def link(self, call_id):
+        return self.links.get(call_id)
+
+    def tool_name(self, call_id, default="Unknown"):
+        link = self.links.get(call_id)
+        return link.name if link else default
+
+    def response_links(self, message):
+        """Links for the calls a tool response answers, skipping unknown call ids."""
+        return [self.links[call_id] for call_id in message.response_ids if call_id in self.links]
+
+    def next_assistant(self, index):
+        """Index of the first assistant message after ``index``, or None."""
+        pos = bisect_right(self._assistant_positions, index)
+        if pos < len(self._assistant_positions):
+            return self._assistant_positions[pos]
+        return None
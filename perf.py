@@ -0,0 +1,240 @@
+"""Timing spans for dashboard reruns.
+
+start_rerun() opens a RerunTimings for the current script run; span() times a block
+into it and does nothing outside a rerun, so the helper modules can stay free of
+Streamlit. MongoCommandTimer records every MongoDB command through pymongo's command
+monitoring. finish_rerun() logs slow reruns, adds the spans to the process-wide
+SPAN_STATS and appends/writes the JSON lines and Prometheus exports when configured.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import bson
+from pymongo import monitoring
+
+from atomic_files import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# Reruns slower than this are logged with their spans
+SLOW_RERUN_SECONDS = float(os.getenv("PERF_SLOW_RERUN_SECONDS", "2.0"))
+# One JSON line per rerun is appended here when set
+JSONL_PATH = os.getenv("PERF_JSONL_PATH")
+# Prometheus text file (for the node_exporter textfile collector) rewritten after each rerun when set
+PROMETHEUS_PATH = os.getenv("PERF_PROMETHEUS_PATH")
+
+_current = ContextVar("rerun_timings", default=None)
+
+
+class Span:
+    __slots__ = ("name", "start", "seconds", "fields")
+
+    def __init__(self, name, start, fields):
+        self.name = name
+        self.start = start      # seconds since the start of the rerun
+        self.seconds = None
+        self.fields = fields    # extra measurements such as docs, bytes or dot_bytes
+
+    def to_record(self):
+        return dict(self.fields, name=self.name, start=round(self.start, 6), seconds=round(self.seconds or 0, 6))
+
+
+class RerunTimings:
+    """Spans recorded during one rerun of the script.
+
+    measure_sizes turns on the measurements that cost time of their own, such as the
+    BSON size of MongoDB replies and the length of the DOT source.
+    """
+
+    def __init__(self, measure_sizes=False):
+        self.measure_sizes = measure_sizes
+        self.started_at = time.time()
+        self.spans = []
+        self.seconds = None
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **fields):
+        span = Span(name, time.perf_counter() - self._start, fields)
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - self._start - span.start
+            self.add(span)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def elapsed(self):
+        return time.perf_counter() - self._start
+
+    def to_record(self, **labels):
+        return dict(labels, started_at=self.started_at, seconds=round(self.seconds or self.elapsed(), 6),
+                    spans=[span.to_record() for span in self.spans])
+
+
+@contextmanager
+def span(name, **fields):
+    """Time a block in the current rerun, if there is one."""
+    timings = _current.get()
+    if timings is None:
+        yield Span(name, 0.0, fields)
+        return
+    with timings.span(name, **fields) as current_span:
+        yield current_span
+
+
+def measuring_sizes():
+    timings = _current.get()
+    return timings is not None and timings.measure_sizes
+
+
+def start_rerun(measure_sizes=False):
+    timings = RerunTimings(measure_sizes)
+    _current.set(timings)
+    return timings
+
+
+class SpanStats:
+    """Process-wide count, total and maximum seconds per span name, for the Prometheus export."""
+
+    def __init__(self):
+        self.reruns = 0
+        self.rerun_seconds = 0.0
+        self.slow_reruns = 0
+        # name -> [count, seconds, max seconds]; reply bytes are only measured while the
+        # perf panel is open, so they stay in the per-rerun spans and are not summed here
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def add(self, timings, slow):
+        with self._lock:
+            self.reruns += 1
+            self.rerun_seconds += timings.seconds
+            self.slow_reruns += slow
+            for span in timings.spans:
+                stats = self.spans.setdefault(span.name, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += span.seconds
+                stats[2] = max(stats[2], span.seconds)
+
+    def rows(self):
+        with self._lock:
+            return [
+                {"span": name, "count": count, "total_seconds": seconds, "mean_seconds": seconds / count,
+                 "max_seconds": max_seconds}
+                for name, (count, seconds, max_seconds) in sorted(self.spans.items())
+            ]
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP agent_hub_reruns_total Dashboard script reruns.",
+            "# TYPE agent_hub_reruns_total counter",
+            f"agent_hub_reruns_total {self.reruns}",
+            "# HELP agent_hub_slow_reruns_total Reruns slower than PERF_SLOW_RERUN_SECONDS.",
+            "# TYPE agent_hub_slow_reruns_total counter",
+            f"agent_hub_slow_reruns_total {self.slow_reruns}",
+            "# HELP agent_hub_rerun_seconds_total Time spent in reruns.",
+            "# TYPE agent_hub_rerun_seconds_total counter",
+            f"agent_hub_rerun_seconds_total {self.rerun_seconds:.6f}",
+            "# HELP agent_hub_span_seconds Time spent per span.",
+            "# TYPE agent_hub_span_seconds summary",
+        ]
+        rows = self.rows()
+        for row in rows:
+            labels = f'{{span="{row["span"]}"}}'
+            lines.append(f"agent_hub_span_seconds_sum{labels} {row['total_seconds']:.6f}")
+            lines.append(f"agent_hub_span_seconds_count{labels} {row['count']}")
+        lines += [
+            "# HELP agent_hub_span_max_seconds Slowest occurrence of each span.",
+            "# TYPE agent_hub_span_max_seconds gauge",
+        ]
+        lines += [f'agent_hub_span_max_seconds{{span="{row["span"]}"}} {row["max_seconds"]:.6f}' for row in rows]
+        return "\n".join(lines) + "\n"
+
+
+SPAN_STATS = SpanStats()
+
+
+def write_prometheus(path, stats=SPAN_STATS):
+    # Reruns of several sessions finish concurrently; the collector never reads half a file
+    with atomic_write(path) as f:
+        f.write(stats.prometheus_text())
+
+
+def append_jsonl(path, timings, **labels):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(timings.to_record(**labels), default=str) + "\n")
+
+
+def finish_rerun(timings, **labels):
+    """Close the rerun: log it if slow, update SPAN_STATS and write the configured exports."""
+    if _current.get() is timings:
+        _current.set(None)
+    timings.seconds = timings.elapsed()
+    slow = timings.seconds > SLOW_RERUN_SECONDS
+    if slow:
+        breakdown = ", ".join(f"{span.name}={span.seconds * 1000:.0f}ms"
+                              for span in sorted(timings.spans, key=lambda s: -s.seconds)[:10])
+        logger.warning("Slow rerun (%.2fs) %s: %s", timings.seconds, labels, breakdown)
+    SPAN_STATS.add(timings, slow)
+    try:
+        if JSONL_PATH:
+            append_jsonl(JSONL_PATH, timings, **labels)
+        if PROMETHEUS_PATH:
+            write_prometheus(PROMETHEUS_PATH)
+    except OSError as exc:
+        logger.warning("Could not export rerun timings: %s", exc)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Records each MongoDB command as a "mongo.<command>" span of the rerun that issued it.
+
+    pymongo calls listeners on the thread that runs the command, so the span lands in
+    that thread's rerun.
+    """
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        timings = _current.get()
+        if timings is None:
+            return
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = (
+                timings, timings.elapsed(), collection if isinstance(collection, str) else None)
+
+    def _finish(self, event, **fields):
+        with self._lock:
+            started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None:
+            return
+        timings, start, collection = started
+        if collection:
+            fields["collection"] = collection
+        span = Span(f"mongo.{event.command_name}", start, fields)
+        span.seconds = event.duration_micros / 1e6
+        timings.add(span)
+
+    def succeeded(self, event):
+        fields = {}
+        reply = event.reply
+        cursor = reply.get("cursor") if isinstance(reply, dict) else None
+        if isinstance(cursor, dict):
+            fields["docs"] = len(cursor.get("firstBatch", cursor.get("nextBatch", [])))
+        if measuring_sizes():
+            fields["bytes"] = len(bson.encode(reply))
+        self._finish(event, **fields)
+
+    def failed(self, event):
+        self._finish(event, error=str(event.failure.get("errmsg", "")) if isinstance(event.failure, dict) else "")
@@ -0,0 +1,71 @@
+"""Background prefetching of the sessions listed in the sidebar.
+
+Tasks run on a thread pool shared by every user of the server, so the number of
+concurrent fetches stays bounded. Each user session has its own Prefetcher: when its
+session list changes, tasks for the old list that have not started are cancelled and
+running ones can check ``cancelled()`` to stop early. A byte cap bounds how much
+document data one list may prefetch; sessions of unknown size are not prefetched.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Prefetcher:
+    def __init__(self, executor, max_bytes):
+        self.executor = executor
+        self.max_bytes = max_bytes
+        self.key = None
+        self._futures = []
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def replace(self, key, tasks):
+        """Prefetch for a new list: ``tasks`` are (size in bytes, function) pairs, in priority order.
+
+        Nothing happens when ``key`` is already the current list. Tasks that would take
+        the list over max_bytes are skipped, and so are tasks whose size is None
+        (unknown), as they could be any size. Each function is called with a
+        ``cancelled()`` callable. Returns the number of tasks scheduled.
+        """
+        with self._lock:
+            if key == self.key:
+                return 0
+            self._cancel()
+            self.key = key
+            generation = self._generation
+            budget = self.max_bytes
+            for size, function in tasks:
+                if size is None or size > budget:
+                    continue
+                budget -= size
+                self._futures.append(self.executor.submit(self._run, generation, function))
+            return len(self._futures)
+
+    def cancel(self):
+        with self._lock:
+            self._cancel()
+
+    def _cancel(self):
+        self._generation += 1
+        for future in self._futures:
+            future.cancel()
+        self._futures = []
+        self.key = None
+
+    def _run(self, generation, function):
+        def cancelled():
+            return generation != self._generation
+
+        if cancelled():
+            return
+        try:
+            function(cancelled)
+        except Exception:  # a failed prefetch only costs the cache miss it was meant to avoid
+            logger.warning("Prefetch failed", exc_info=True)
+
+    @property
+    def pending(self):
+        with self._lock:
+            return sum(not future.done() for future in self._futures)
@@ -0,0 +1,57 @@
+"""Fill the MongoDB rollups behind the analytics view, outside the dashboard.
+
+    python rollup_sessions.py --database snaplogic              # roll up what was added since the last run
+    python rollup_sessions.py --database snaplogic --every 300  # keep rolling up, e.g. as a sidecar
+
+The dashboard's analytics view only reads the LogRollup collection; this script fills
+it with session_store.update_rollups(). The first run rolls up every Log document,
+later runs only new documents and the sessions that were still running. Run it from
+cron or with --every; sessions show up in the analytics once it has rolled them up.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from session_store import update_rollups
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database", required=True, help="MongoDB database holding the Log collection")
+    parser.add_argument("--uri", help="MongoDB connection string, default $MONGO_URI")
+    parser.add_argument("--every", type=float, help="keep running, rolling up new sessions every this many seconds")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    load_dotenv()
+    uri = args.uri or os.getenv("MONGO_URI")
+    if not uri:
+        raise SystemExit("Set MONGO_URI or pass --uri")
+    collection = MongoClient(uri).get_database(args.database).get_collection("Log")
+
+    while True:
+        started = time.perf_counter()
+        try:
+            newest = update_rollups(collection)
+        except PyMongoError as exc:
+            if not args.every:
+                raise
+            # Keep the service running through failovers and network errors
+            logger.warning("Rolling up %s failed: %s", collection.full_name, exc)
+        else:
+            logger.info("Rolled up %s up to %s in %.1fs", collection.full_name, newest, time.perf_counter() - started)
+        if not args.every:
+            return 0
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Full-text search over message contents, tool names and tool arguments.
+
+search_terms() turns a normalized message into the terms it is found by. MongoDB
+stores those terms per message in a text-indexed side collection
+(session_store.update_search_index(), run by index_search.py); export files are
+searched with SearchIndex, an in-memory inverted index. Messages are indexed under
+their words and the parts of camelCase words, queries look for whole words only
+(query_terms()). Both backends rank sessions by the summed scores of their matching
+messages and return the matching message ids best first, so the history can jump
+straight to the best match.
+"""
+import heapq
+import math
+import re
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Optional
+
+import numpy as np
+
+from message_model import TOOL_RESPONSE, SessionIndex
+
+# Only the first part of very long messages (large tool payloads) is indexed
+MAX_MESSAGE_CHARS = 20000
+# Keys whose values are generated ids rather than text
+ID_KEYS = frozenset(("id", "toolUseId", "function_id", "tool_call_id", "type"))
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were with about".split())
+
+_WORD = re.compile(r"[A-Za-z0-9]+")
+# Parts of camelCase and PascalCase words, so "Story" also finds "PlanStoryStructure"
+_WORD_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+
+@dataclass
+class SearchHit:
+    session_id: str
+    agent_name: Optional[str] = None
+    doc_id: Any = None
+    score: float = 0.0
+    message_ids: list = field(default_factory=list)  # matching message indexes, best match first
+
+
+def _term(word):
+    term = word.lower()
+    if term in STOP_WORDS or len(term) < 2:
+        return None
+    # Plurals find their singular and the other way round
+    if len(term) > 3 and term.endswith("s") and not term.endswith("ss"):
+        term = term[:-1]
+    return term
+
+
+@lru_cache(maxsize=65536)
+def _word_terms(word):
+    parts = _WORD_PART.findall(word)
+    pieces = [word] + parts if len(parts) > 1 else [word]
+    return tuple(term for term in map(_term, pieces) if term)
+
+
+def tokenize(text):
+    """Search terms of a text: lowercased words and the parts of camelCase words."""
+    terms = []
+    for word in _WORD.findall(text):
+        terms.extend(_word_terms(word))
+    return terms
+
+
+def query_terms(query):
+    """Terms a query looks for: its whole words, so "PlanStoryStructure" doesn't match every "Story"."""
+    return list(dict.fromkeys(term for term in map(_term, _WORD.findall(query)) if term))
+
+
+def term_counts(text):
+    """tokenize() as term -> count, counting each distinct word once."""
+    counts = Counter()
+    for word, count in Counter(_WORD.findall(text)).items():
+        for term in _word_terms(word):
+            counts[term] += count
+    return counts
+
+
+def _collect_strings(value, parts):
+    if isinstance(value, str):
+        parts.append(value)
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            if key not in ID_KEYS:
+                _collect_strings(item, parts)
+    elif isinstance(value, list):
+        for item in value:
+            _collect_strings(item, parts)
+
+
+def message_text(message, session_index):
+    """Text a message is found by: its content, tool names and arguments, and the tools it answers."""
+    parts = []
+    _collect_strings(message.raw.get("content"), parts)
+    for _, name, arguments in message.tool_calls:
+        parts.append(name)
+        _collect_strings(arguments, parts)
+    if message.kind == TOOL_RESPONSE:
+        parts.extend(link.name for link in session_index.response_links(message))
+    return " ".join(parts)[:MAX_MESSAGE_CHARS]
+
+
+def search_terms(message, session_index):
+    return tokenize(message_text(message, session_index))
+
+
+class SearchIndex:
+    """Inverted index from terms to the messages containing them, for a fixed set of sessions.
+
+    Documents are added once with add(); ``key`` is whatever the caller needs to find
+    the session again. Message scores are tf-idf divided by the square root of the
+    message's term count, with the idf computed by the caller, so several indexes (one
+    per export file) can be searched as one.
+    """
+
+    def __init__(self):
+        self.documents = []                 # caller's key per document number
+        self._message_docs = array("I")     # document number per message number
+        self._message_ids = array("I")      # message index within its session per message number
+        self._message_norms = array("f")    # 1 / sqrt(terms) per message number, so long messages don't win
+        self._postings = {}                 # term -> (message numbers, term counts)
+
+    @property
+    def message_count(self):
+        return len(self._message_docs)
+
+    def document_frequency(self, term):
+        posting = self._postings.get(term)
+        return len(posting[0]) if posting else 0
+
+    def add(self, key, messages):
+        """Index a session's normalized messages."""
+        document = len(self.documents)
+        self.documents.append(key)
+        session_index = SessionIndex(messages)
+        for message in messages:
+            counts = term_counts(message_text(message, session_index))
+            if not counts:
+                continue
+            number = len(self._message_docs)
+            self._message_docs.append(document)
+            self._message_ids.append(message.index)
+            self._message_norms.append(1 / math.sqrt(sum(counts.values())))
+            for term, count in counts.items():
+                posting = self._postings.get(term)
+                if posting is None:
+                    posting = self._postings[term] = (array("I"), array("I"))
+                posting[0].append(number)
+                posting[1].append(count)
+
+    def search(self, idf):
+        """Yield (document number, score, message ids) of the matching documents, best first.
+
+        ``idf`` maps each query term to its weight. Message ids are ordered by their own score.
+        """
+        scores = np.zeros(self.message_count)
+        for term, weight in idf.items():
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            numbers = np.frombuffer(posting[0], dtype=np.uintc)
+            counts = np.frombuffer(posting[1], dtype=np.uintc)
+            scores[numbers] += (1 + np.log(counts)) * weight
+        matched = np.flatnonzero(scores)
+        if not matched.size:
+            return
+        message_scores = scores[matched] * np.frombuffer(self._message_norms, dtype=np.float32)[matched]
+        documents = np.frombuffer(self._message_docs, dtype=np.uintc)[matched]
+        message_ids = np.frombuffer(self._message_ids, dtype=np.uintc)[matched]
+        document_scores = np.bincount(documents, weights=message_scores, minlength=len(self.documents))
+        # By document, then best message first; ties keep session order
+        order = np.lexsort((message_ids, -message_scores, documents))
+        documents = documents[order]
+        message_ids = message_ids[order]
+        for document in np.argsort(-document_scores, kind="stable"):
+            score = document_scores[document]
+            if score <= 0:
+                break
+            start, end = np.searchsorted(documents, [document, document + 1])
+            yield int(document), float(score), message_ids[start:end].tolist()
+
+
+def search_indexes(indexes, query):
+    """Yield (position in ``indexes``, document number, score, message ids) over several SearchIndexes, best first."""
+    terms = query_terms(query)
+    total = sum(index.message_count for index in indexes)
+    idf = {}
+    for term in terms:
+        frequency = sum(index.document_frequency(term) for index in indexes)
+        if frequency:
+            idf[term] = math.log(1 + total / frequency)
+    if not idf:
+        return iter(())
+    results = [_positioned(position, index.search(idf)) for position, index in enumerate(indexes)]
+    return heapq.merge(*results, key=lambda result: -result[2])
+
+
+def _positioned(position, results):
+    for document, score, message_ids in results:
+        yield position, document, score, message_ids
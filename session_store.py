@@ -0,0 +1,773 @@
+"""MongoDB access helpers for the agent-hub dashboard.
+
+Everything in here is plain pymongo so it can be used outside of Streamlit;
+agent-hub.py wraps these helpers with the Streamlit caches. MongoLogStore bundles
+them behind the interface shared with file_store.FileLogStore.
+"""
+import hashlib
+import json
+import logging
+import re
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from message_model import (
+    ASSISTANT, ERROR, KIND_FILTER_ROLES, OTHER, SYSTEM, TOOL_CALL, TOOL_RESPONSE, USER, SessionIndex,
+    filter_messages, normalize_message, normalize_messages,
+)
+from search_index import SearchHit, query_terms, search_terms
+
+logger = logging.getLogger(__name__)
+
+# Only the fields the dashboard reads from a Log document
+SESSION_PROJECTION = {"messages": 1, "sessionId": 1, "agentName": 1, "sfdcUserId": 1}
+# Fields needed to list sessions in the sidebar
+SESSION_LIST_PROJECTION = {"sessionId": 1, "agentName": 1}
+
+# Per-session metrics materialized for the analytics view, and the progress of the job filling it (rollup_sessions.py)
+ROLLUP_COLLECTION = "LogRollup"
+ROLLUP_STATE_COLLECTION = "LogRollupState"
+# Documents younger than this are rolled up again, as their sessions may still be running
+ROLLUP_OPEN_WINDOW = timedelta(hours=1)
+# errorTools name for errors that happen before any tool was called
+NO_TOOL = "(no tool)"
+
+# Search terms per message, text-indexed, and the progress of the job filling it (index_search.py)
+SEARCH_COLLECTION = "LogSearch"
+SEARCH_STATE_COLLECTION = "LogSearchState"
+SEARCH_TEXT_INDEX = [("terms", TEXT)]
+# One entry per message, however many indexers run at once
+SEARCH_MESSAGE_INDEX = [("logId", ASCENDING), ("index", ASCENDING)]
+# Upserts sent to the search collection per bulk write
+SEARCH_BATCH_SIZE = 1000
+# Sessions returned by a search
+SEARCH_LIMIT = 20
+# MongoDB error codes handled by the search indexing
+DUPLICATE_KEY = 11000
+INDEX_OPTIONS_CONFLICT = 85
+INDEX_KEY_SPECS_CONFLICT = 86
+
+# Indexes backing the session lookup, the agent filter and the newest-first session list
+LOG_INDEXES = [
+    [("sessionId", ASCENDING)],
+    [("agentName", ASCENDING)],
+    [("agentName", ASCENDING), ("_id", DESCENDING)],
+]
+
+
+@dataclass
+class Session:
+    session_id: str
+    agent_name: Optional[str] = None
+    sfdc_user_id: Optional[str] = None
+    messages: list = field(default_factory=list)
+    doc_id: Any = None
+    message_count: int = 0
+    last_message: Any = None
+    max_parallel_calls: int = 0
+
+    @classmethod
+    def from_document(cls, doc):
+        messages = doc.get("messages") or []
+        return cls(
+            session_id=doc.get("sessionId"),
+            agent_name=doc.get("agentName"),
+            sfdc_user_id=doc.get("sfdcUserId"),
+            messages=messages,
+            doc_id=doc.get("_id"),
+            message_count=len(messages),
+            last_message=messages[-1] if messages else None,
+        )
+
+    @property
+    def fingerprint(self):
+        """Cheap version key: changes whenever messages are appended to or replace the last one."""
+        last = json.dumps(self.last_message, sort_keys=True, default=str) if self.message_count else ""
+        digest = hashlib.sha1(last.encode("utf-8")).hexdigest()[:16]
+        return f"{self.doc_id}:{self.message_count}:{digest}"
+
+
+@dataclass
+class MessagePage:
+    total: int                  # messages matching the role filter
+    skip: int                   # position of the first message of this page in the filtered list
+    messages: list              # normalized Message records of the page
+    session_index: SessionIndex  # links for the tool calls answered on this page
+    position: int = -1          # position of the requested jump target in the filtered list
+
+
+@dataclass
+class SessionPage:
+    sessions: list
+    has_newer: bool = False
+    has_older: bool = False
+
+    @property
+    def first_id(self):
+        return self.sessions[0]["_id"] if self.sessions else None
+
+    @property
+    def last_id(self):
+        return self.sessions[-1]["_id"] if self.sessions else None
+
+
+def load_session(collection, session_id):
+    """Fetch a single session document (projected) or None if it does not exist."""
+    if not session_id:
+        return None
+    doc = collection.find_one({"sessionId": session_id}, SESSION_PROJECTION)
+    if doc is None:
+        return None
+    return Session.from_document(doc)
+
+
+def ensure_indexes(collection):
+    """Create the Log indexes if missing. Returns False when the user is not allowed to."""
+    try:
+        for keys in LOG_INDEXES:
+            collection.create_index(keys)
+    except OperationFailure as exc:
+        # Read-only users can still browse, just without the index guarantees
+        logger.warning("Could not ensure indexes on %s: %s", collection.full_name, exc)
+        return False
+    return True
+
+
+def list_sessions(collection, agent_name=None, session_prefix=None, page_size=10, before_id=None, after_id=None):
+    """Return one page of sessions, newest first, paged with _id keyset cursors.
+
+    Pass the last _id of the current page as before_id to go further back, or the
+    first _id as after_id to come forward again.
+    """
+    query = {}
+    if agent_name:
+        query["agentName"] = agent_name
+    if session_prefix:
+        # Anchored, case-sensitive regex so the sessionId index can be used
+        query["sessionId"] = {"$regex": "^" + re.escape(session_prefix)}
+
+    if before_id is not None:
+        query["_id"] = {"$lt": before_id}
+        direction = DESCENDING
+    elif after_id is not None:
+        query["_id"] = {"$gt": after_id}
+        direction = ASCENDING
+    else:
+        direction = DESCENDING
+
+    # Fetch one extra document to know whether there is another page in that direction
+    docs = list(collection.find(query, SESSION_LIST_PROJECTION).sort("_id", direction).limit(page_size + 1))
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+
+    if after_id is not None:
+        docs.reverse()
+        return SessionPage(docs, has_newer=has_more, has_older=True)
+    return SessionPage(docs, has_newer=before_id is not None, has_older=has_more)
+
+
+def session_query(agent_name=None, session_ids=None, min_id=None, max_id=None):
+    """Log query selecting sessions by agent, sessionId list and inclusive _id range."""
+    query = {}
+    if agent_name:
+        query["agentName"] = agent_name
+    if session_ids:
+        query["sessionId"] = {"$in": list(session_ids)}
+    if min_id is not None or max_id is not None:
+        query["_id"] = {}
+        if min_id is not None:
+            query["_id"]["$gte"] = min_id
+        if max_id is not None:
+            query["_id"]["$lte"] = max_id
+    return query
+
+
+def iter_session_documents(collection, agent_name=None, session_ids=None, min_id=None, max_id=None,
+                           batch_size=100):
+    """Stream the selected Log documents (projected), oldest first, a cursor batch at a time."""
+    query = session_query(agent_name, session_ids, min_id, max_id)
+    return collection.find(query, SESSION_PROJECTION).sort("_id", ASCENDING).batch_size(batch_size)
+
+
+def list_agent_names(collection):
+    """Distinct agent names, sorted. The leading $sort lets MongoDB walk the agentName index."""
+    pipeline = [
+        {"$sort": {"agentName": 1}},
+        {"$group": {"_id": "$agentName"}},
+    ]
+    names = {doc["_id"] for doc in collection.aggregate(pipeline) if doc["_id"]}
+    return sorted(names)
+
+
+# Aggregation expressions mirroring message_model.normalize_message(), so the role filter
+# can run inside MongoDB. ``m`` is the expression of the message being classified.
+
+# Values Python treats as false; MongoDB only treats false, null, 0 and missing fields as false
+_FALSY_VALUES = [False, None, 0, "", [], {}]
+
+
+def _truthy_expr(value):
+    """Python truthiness of ``value``, so "", [] and {} count as false as they do in normalize_message()."""
+    return {"$not": [{"$in": [{"$ifNull": [value, None]}, {"$literal": _FALSY_VALUES}]}]}
+
+
+def _get_expr(path, default):
+    """dict.get(key, default): ``default`` only when the field is missing, not when it is null."""
+    return {"$cond": [{"$eq": [{"$type": path}, "missing"]}, default, path]}
+
+
+def _array_expr(value):
+    return {"$cond": [{"$isArray": value}, value, []]}
+
+
+def _content_blocks_expr(m, key):
+    """The ``key`` values (toolUse, toolResult) of the content blocks that have one."""
+    return {"$map": {
+        "input": {"$filter": {
+            "input": _array_expr(f"{m}.content"),
+            "as": "block",
+            "cond": {"$and": [{"$eq": [{"$type": "$$block"}, "object"]}, _truthy_expr(f"$$block.{key}")]},
+        }},
+        "as": "block",
+        "in": f"$$block.{key}",
+    }}
+
+
+def _tool_call_count_expr(m):
+    return {"$add": [
+        {"$size": _array_expr(f"{m}.tool_calls")},
+        {"$size": _content_blocks_expr(m, "toolUse")},
+    ]}
+
+
+def _kind_expr(m):
+    """{kind, isError} of a message, with kind "skip" for entries that are not documents."""
+    sl_role = {"$toLower": {"$ifNull": [f"{m}.sl_role", ""]}}
+    raw_role = {"$toLower": {"$ifNull": [f"{m}.role", ""]}}
+    tool_results = _content_blocks_expr(m, "toolResult")
+    branches = [
+        {"case": {"$ne": [{"$type": m}, "object"]},
+         "then": {"kind": "skip", "isError": False}},
+        {"case": {"$or": [{"$eq": ["$$role", "error"]}, {"$eq": ["$$raw_role", "error"]}]},
+         "then": {"kind": ERROR, "isError": True}},
+        {"case": {"$eq": [{"$substrCP": ["$$role", 0, 9]}, "assistant"]},
+         "then": {"kind": {"$cond": [{"$gt": [_tool_call_count_expr(m), 0]}, TOOL_CALL, ASSISTANT]},
+                  "isError": False}},
+        {"case": {"$gt": [{"$size": "$$results"}, 0]},
+         "then": {"kind": TOOL_RESPONSE,
+                  "isError": {"$gt": [{"$size": {"$filter": {
+                      "input": "$$results", "as": "result", "cond": _truthy_expr("$$result.error")}}}, 0]}}},
+        {"case": {"$eq": [{"$substrCP": ["$$role", 0, 4]}, "tool"]},
+         "then": {"kind": TOOL_RESPONSE, "isError": False}},
+        {"case": {"$eq": ["$$role", "system"]}, "then": {"kind": SYSTEM, "isError": False}},
+        {"case": {"$eq": ["$$role", "user"]}, "then": {"kind": USER, "isError": False}},
+    ]
+    return {"$let": {
+        "vars": {"sl_role": sl_role, "raw_role": raw_role, "results": tool_results},
+        "in": {"$let": {
+            # sl_role wins over role unless it is missing or empty
+            "vars": {"role": {"$cond": [{"$eq": ["$$sl_role", ""]}, "$$raw_role", "$$sl_role"]}},
+            "in": {"$switch": {"branches": branches, "default": {"kind": OTHER, "isError": False}}},
+        }},
+    }}
+
+
+def _classified_message_expr(m, index):
+    """Per-message summary used for filtering: index, kind, error flag, tool call ids and answered ids.
+
+    ``m`` must be a variable reference such as "$$m" so field paths can be appended to it.
+    """
+    tool_calls = {"$concatArrays": [
+        {"$map": {"input": _array_expr(f"{m}.tool_calls"), "as": "call",
+                  "in": {"id": {"$ifNull": ["$$call.id", None]},
+                         "name": _get_expr("$$call.function.name", "Unknown")}}},
+        {"$map": {"input": _content_blocks_expr(m, "toolUse"), "as": "use",
+                  "in": {"id": {"$ifNull": ["$$use.toolUseId", None]}, "name": _get_expr("$$use.name", "Unknown")}}},
+    ]}
+    # The toolResult ids when there are any, else function_id or tool_call_id
+    tool_results = _content_blocks_expr(m, "toolResult")
+    call_id = {"$cond": [_truthy_expr(f"{m}.function_id"), f"{m}.function_id",
+                         {"$ifNull": [f"{m}.tool_call_id", None]}]}
+    response_ids = {"$cond": [
+        {"$gt": [{"$size": tool_results}, 0]},
+        {"$map": {"input": tool_results, "as": "result", "in": _get_expr("$$result.toolUseId", "")}},
+        {"$let": {"vars": {"call_id": call_id}, "in": {"$cond": [_truthy_expr("$$call_id"), ["$$call_id"], []]}}},
+    ]}
+    return {"$let": {
+        "vars": {"classified": _kind_expr(m)},
+        "in": {
+            "index": index,
+            "kind": "$$classified.kind",
+            "isError": "$$classified.isError",
+            "calls": {"$cond": [{"$eq": ["$$classified.kind", TOOL_CALL]}, tool_calls, []]},
+            "responseIds": {"$cond": [{"$eq": ["$$classified.kind", TOOL_RESPONSE]}, response_ids, []]},
+        },
+    }}
+
+
+def _classified_messages_expr(messages):
+    """_classified_message_expr() of every message of an array, with 1-based indexes."""
+    return {"$map": {
+        "input": {"$range": [0, {"$size": messages}]},
+        "as": "i",
+        "in": {"$let": {
+            "vars": {"m": {"$arrayElemAt": [messages, "$$i"]}},
+            "in": _classified_message_expr("$$m", {"$add": ["$$i", 1]}),
+        }},
+    }}
+
+
+def _role_filter_expr(c, roles):
+    conditions = []
+    for role in {role.lower() for role in roles}:
+        kinds = [kind for kind, kind_roles in KIND_FILTER_ROLES.items() if role in kind_roles]
+        if kinds:
+            conditions.append({"$in": [f"{c}.kind", kinds]})
+        if role == "error":
+            # Failed tool results count as errors too
+            conditions.append({"$eq": [f"{c}.isError", True]})
+    return {"$or": conditions} if conditions else False
+
+
+def load_session_summary(collection, session_id):
+    """Session header without the messages: count, last message (for the fingerprint) and widest tool fan-out."""
+    if not session_id:
+        return None
+    messages = {"$ifNull": ["$messages", []]}
+    pipeline = [
+        {"$match": {"sessionId": session_id}},
+        {"$limit": 1},
+        {"$project": {
+            "sessionId": 1,
+            "agentName": 1,
+            "sfdcUserId": 1,
+            "messageCount": {"$size": messages},
+            "lastMessage": {"$arrayElemAt": [messages, -1]},
+            "maxParallelCalls": {"$max": {"$map": {
+                "input": messages, "as": "m",
+                "in": {"$cond": [{"$eq": [{"$type": "$$m"}, "object"]}, _tool_call_count_expr("$$m"), 0]},
+            }}},
+        }},
+    ]
+    docs = list(collection.aggregate(pipeline))
+    if not docs:
+        return None
+    doc = docs[0]
+    return Session(
+        session_id=doc.get("sessionId"),
+        agent_name=doc.get("agentName"),
+        sfdc_user_id=doc.get("sfdcUserId"),
+        messages=[],
+        doc_id=doc.get("_id"),
+        message_count=doc.get("messageCount", 0),
+        last_message=doc.get("lastMessage"),
+        max_parallel_calls=doc.get("maxParallelCalls") or 0,
+    )
+
+
+def load_message_page(collection, session_id, roles, skip=0, limit=50, jump_to=None):
+    """One page of a session's messages matching the role filter, filtered and sliced in MongoDB.
+
+    With jump_to (a message index) the page containing that message is returned instead
+    of the one at ``skip``. Returns None if the session does not exist.
+    """
+    if not session_id:
+        return None
+    pipeline = [
+        {"$match": {"sessionId": session_id}},
+        {"$limit": 1},
+        {"$project": {"messages": {"$ifNull": ["$messages", []]}}},
+        {"$addFields": {"classified": _classified_messages_expr("$messages")}},
+        {"$addFields": {"matched": {"$filter": {
+            "input": "$classified", "as": "c", "cond": _role_filter_expr("$$c", roles),
+        }}}},
+        {"$addFields": {"position": {"$indexOfArray": ["$matched.index", jump_to]} if jump_to else -1}},
+        {"$addFields": {"skip": {"$cond": [
+            {"$gte": ["$position", 0]},
+            {"$multiply": [{"$floor": {"$divide": ["$position", limit]}}, limit]},
+            skip,
+        ]}}},
+        {"$addFields": {"page": {"$slice": ["$matched", "$skip", limit]}}},
+        {"$addFields": {"pageResponseIds": {"$reduce": {
+            "input": "$page.responseIds", "initialValue": [], "in": {"$concatArrays": ["$$value", "$$this"]},
+        }}}},
+        {"$project": {
+            "_id": 0,
+            "total": {"$size": "$matched"},
+            "skip": 1,
+            "position": 1,
+            "messages": {"$map": {"input": "$page", "as": "c", "in": {
+                "index": "$$c.index",
+                "message": {"$arrayElemAt": ["$messages", {"$subtract": ["$$c.index", 1]}]},
+            }}},
+            # Only the calls answered on this page, to name the tool responses
+            "calls": {"$filter": {"input": "$classified", "as": "c", "cond": {"$and": [
+                {"$eq": ["$$c.kind", TOOL_CALL]},
+                {"$gt": [{"$size": {"$setIntersection": ["$$c.calls.id", "$pageResponseIds"]}}, 0]},
+            ]}}},
+        }},
+    ]
+    docs = list(collection.aggregate(pipeline))
+    if not docs:
+        return None
+    doc = docs[0]
+    calls = [(entry["index"], call["id"], call["name"]) for entry in doc["calls"] for call in entry["calls"]]
+    return MessagePage(
+        total=doc["total"],
+        skip=int(doc["skip"]),
+        messages=[normalize_message(entry["index"], entry["message"]) for entry in doc["messages"]],
+        session_index=SessionIndex.from_calls(calls),
+        position=doc["position"],
+    )
+
+
+def paginate_messages(messages, session_index, roles, skip=0, limit=50, jump_to=None):
+    """load_message_page() for a session whose normalized messages are already in memory."""
+    matched = filter_messages(messages, roles)
+    position = -1
+    if jump_to:
+        position = next((pos for pos, message in enumerate(matched) if message.index == jump_to), -1)
+        if position >= 0:
+            skip = position // limit * limit
+    return MessagePage(
+        total=len(matched),
+        skip=skip,
+        messages=matched[skip:skip + limit],
+        session_index=session_index,
+        position=position,
+    )
+
+
+def count_session_errors(collection, session_ids):
+    """Error messages per session, counted in MongoDB without returning any message bodies."""
+    pipeline = [
+        {"$match": {"sessionId": {"$in": list(session_ids)}}},
+        {"$project": {"_id": 0, "sessionId": 1, "errors": {"$size": {"$filter": {
+            "input": {"$ifNull": ["$messages", []]},
+            "as": "m",
+            "cond": {"$let": {"vars": {"classified": _kind_expr("$$m")}, "in": "$$classified.isError"}},
+        }}}}},
+    ]
+    return {doc["sessionId"]: doc["errors"] for doc in collection.aggregate(pipeline)}
+
+
+def session_sizes(collection, session_ids):
+    """BSON size of each session's Log document, measured in MongoDB without returning it."""
+    pipeline = [
+        {"$match": {"sessionId": {"$in": list(session_ids)}}},
+        {"$project": {"_id": 0, "sessionId": 1, "bytes": {"$bsonSize": "$$ROOT"}}},
+    ]
+    sizes = {}
+    try:
+        for doc in collection.aggregate(pipeline):
+            sizes.setdefault(doc["sessionId"], doc["bytes"])
+    except OperationFailure as exc:
+        # $bsonSize needs MongoDB 4.4; without it sizes are unknown and those sessions are not prefetched
+        logger.warning("Could not measure sessions in %s: %s", collection.full_name, exc)
+    return sizes
+
+
+def _count_name_expr(counts, name):
+    """``counts`` ([{name, count}]) with ``name`` counted once more.
+
+    Only as long as the number of distinct names, so counting inside $reduce stays
+    linear in the messages, unlike collecting every name with $concatArrays first.
+    """
+    return {"$cond": [
+        {"$in": [name, {"$map": {"input": counts, "as": "entry", "in": "$$entry.name"}}]},
+        {"$map": {"input": counts, "as": "entry", "in": {"$cond": [
+            {"$eq": ["$$entry.name", name]},
+            {"name": "$$entry.name", "count": {"$add": ["$$entry.count", 1]}},
+            "$$entry",
+        ]}}},
+        {"$concatArrays": [counts, [{"name": name, "count": 1}]]},
+    ]}
+
+
+def _rollup_pipeline(match):
+    """One rollup document per Log document, matching analytics.session_rollup()."""
+    return [
+        {"$match": match},
+        {"$project": {
+            "sessionId": 1,
+            "agentName": {"$ifNull": ["$agentName", None]},
+            "messageCount": {"$size": {"$ifNull": ["$messages", []]}},
+            "classified": _classified_messages_expr({"$ifNull": ["$messages", []]}),
+        }},
+        {"$addFields": {
+            "toolCalls": {"$reduce": {
+                "input": "$classified", "initialValue": [],
+                "in": {"$reduce": {
+                    "input": "$$this.calls.name", "initialValue": "$$value",
+                    "in": _count_name_expr("$$value", "$$this"),
+                }},
+            }},
+            # Counted by the name of the tool called most recently before each error
+            "errorTools": {"$reduce": {
+                "input": "$classified",
+                "initialValue": {"last": None, "counts": []},
+                "in": {
+                    "last": {"$cond": [{"$gt": [{"$size": "$$this.calls"}, 0]},
+                                       {"$arrayElemAt": ["$$this.calls.name", -1]}, "$$value.last"]},
+                    "counts": {"$cond": ["$$this.isError",
+                                         _count_name_expr("$$value.counts", {"$ifNull": ["$$value.last", NO_TOOL]}),
+                                         "$$value.counts"]},
+                },
+            }},
+        }},
+        {"$project": {
+            "sessionId": 1,
+            "agentName": 1,
+            "messageCount": 1,
+            "turns": {"$size": {"$filter": {
+                "input": "$classified", "as": "c", "cond": {"$in": ["$$c.kind", [ASSISTANT, TOOL_CALL]]},
+            }}},
+            "errors": {"$size": {"$filter": {"input": "$classified", "as": "c", "cond": "$$c.isError"}}},
+            "toolCalls": 1,
+            "errorTools": "$errorTools.counts",
+        }},
+    ]
+
+
+def update_rollups(collection):
+    """Bring the rollup collection up to date with the Log documents added since the last run.
+
+    Documents created within ROLLUP_OPEN_WINDOW are rolled up again, so sessions that
+    were still running last time are refreshed. This writes to the database and scans
+    every new document, so it runs in rollup_sessions.py rather than in the dashboard.
+    Returns the _id of the newest document rolled up, None for an empty collection.
+    """
+    database = collection.database
+    state_collection = database.get_collection(ROLLUP_STATE_COLLECTION)
+    state = state_collection.find_one({"_id": collection.name}) or {}
+    last_id = state.get("lastId")
+
+    newest = collection.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    if newest is None:
+        return 0
+    match = {"_id": {"$lte": newest["_id"]}}
+    if last_id is not None:
+        lower = last_id
+        if isinstance(last_id, ObjectId):
+            lower = min(last_id, ObjectId.from_datetime(datetime.now(timezone.utc) - ROLLUP_OPEN_WINDOW))
+        match["_id"]["$gt"] = lower
+
+    pipeline = _rollup_pipeline(match) + [
+        {"$merge": {"into": ROLLUP_COLLECTION, "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+    collection.aggregate(pipeline)
+    state_collection.update_one(
+        {"_id": collection.name},
+        {"$set": {"lastId": newest["_id"], "updatedAt": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return newest["_id"]
+
+
+def load_rollups(collection, agent_name=None):
+    """Per-session rollups for the analytics view, as of the last rollup_sessions.py run."""
+    query = {"agentName": agent_name} if agent_name else {}
+    return list(collection.database.get_collection(ROLLUP_COLLECTION).find(query))
+
+
+def _search_updates(doc, start=0):
+    """Upserts of the search terms of a Log document's messages after index ``start``."""
+    messages = normalize_messages(doc.get("messages") or [])
+    session_index = SessionIndex(messages)
+    for message in messages:
+        if message.index <= start:
+            continue
+        yield UpdateOne({"logId": doc["_id"], "index": message.index}, {"$set": {
+            "sessionId": doc.get("sessionId"),
+            "agentName": doc.get("agentName"),
+            "terms": " ".join(search_terms(message, session_index)),
+        }}, upsert=True)
+
+
+def _write_search_updates(search_collection, docs, starts=None):
+    """Index the messages of ``docs``; returns the number of documents processed."""
+    processed = 0
+    batch = []
+    for doc in docs:
+        processed += 1
+        batch.extend(_search_updates(doc, (starts or {}).get(doc["_id"], 0)))
+        if len(batch) >= SEARCH_BATCH_SIZE:
+            _bulk_upsert(search_collection, batch)
+            batch = []
+    if batch:
+        _bulk_upsert(search_collection, batch)
+    return processed
+
+
+def _bulk_upsert(search_collection, batch):
+    try:
+        search_collection.bulk_write(batch, ordered=False)
+    except BulkWriteError as exc:
+        # Another indexer inserted the same message first; its entry has the same terms
+        if any(error.get("code") != DUPLICATE_KEY for error in exc.details.get("writeErrors", [])):
+            raise
+
+
+def ensure_search_indexes(collection):
+    """Create the indexes of the search collection next to ``collection``.
+
+    Search collections of earlier versions had a non-unique message index, so concurrent
+    updates could store a message twice; those duplicates are removed before the index
+    is made unique.
+    """
+    search_collection = collection.database.get_collection(SEARCH_COLLECTION)
+    search_collection.create_index(SEARCH_TEXT_INDEX)
+    try:
+        search_collection.create_index(SEARCH_MESSAGE_INDEX, unique=True)
+    except OperationFailure as exc:
+        if exc.code not in (INDEX_OPTIONS_CONFLICT, INDEX_KEY_SPECS_CONFLICT):
+            raise
+        logger.info("Making the message index of %s unique", search_collection.full_name)
+        search_collection.drop_index(SEARCH_MESSAGE_INDEX)
+        duplicates = search_collection.aggregate([
+            {"$group": {"_id": {"logId": "$logId", "index": "$index"}, "ids": {"$push": "$_id"},
+                        "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        for duplicate in duplicates:
+            search_collection.delete_many({"_id": {"$in": duplicate["ids"][1:]}})
+        search_collection.create_index(SEARCH_MESSAGE_INDEX, unique=True)
+
+
+def update_search_index(collection):
+    """Index the messages added to the Log collection since the last run.
+
+    Like update_rollups(), documents created within ROLLUP_OPEN_WINDOW are checked
+    again, but only those that grew are fetched and only their new messages indexed;
+    messages are only ever appended. The first run indexes the whole collection, so this
+    runs in index_search.py rather than in the dashboard; call ensure_search_indexes()
+    once before. Returns the number of documents processed; raises OperationFailure when
+    the user may not write the search collection.
+    """
+    database = collection.database
+    search_collection = database.get_collection(SEARCH_COLLECTION)
+    state_collection = database.get_collection(SEARCH_STATE_COLLECTION)
+    state = state_collection.find_one({"_id": collection.name}) or {}
+    last_id = state.get("lastId")
+
+    newest = collection.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    if newest is None:
+        return 0
+
+    processed = 0
+    if last_id is not None:
+        if isinstance(last_id, ObjectId):
+            window = {"$gt": ObjectId.from_datetime(datetime.now(timezone.utc) - ROLLUP_OPEN_WINDOW),
+                      "$lte": last_id}
+            sizes = {doc["_id"]: doc["messageCount"] for doc in collection.aggregate([
+                {"$match": {"_id": window}},
+                {"$project": {"messageCount": {"$size": {"$ifNull": ["$messages", []]}}}},
+            ])}
+            indexed = {doc["_id"]: doc["indexed"] for doc in search_collection.aggregate([
+                {"$match": {"logId": window}},
+                {"$group": {"_id": "$logId", "indexed": {"$max": "$index"}}},
+            ])}
+            grown = [doc_id for doc_id, size in sizes.items() if size > indexed.get(doc_id, 0)]
+            if grown:
+                docs = collection.find({"_id": {"$in": grown}}, SESSION_PROJECTION)
+                processed += _write_search_updates(search_collection, docs, indexed)
+        query = {"_id": {"$gt": last_id, "$lte": newest["_id"]}}
+    else:
+        query = {"_id": {"$lte": newest["_id"]}}
+    docs = collection.find(query, SESSION_PROJECTION).sort("_id", ASCENDING).batch_size(100)
+    processed += _write_search_updates(search_collection, docs)
+
+    state_collection.update_one(
+        {"_id": collection.name},
+        {"$set": {"lastId": newest["_id"], "updatedAt": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+    return processed
+
+
+def search_sessions(collection, query, agent_name=None, limit=SEARCH_LIMIT):
+    """Sessions with messages containing any of the query's words, best first, with the matching message ids.
+
+    The query's words are turned into terms like the messages' (search_index.query_terms()),
+    so both backends find the same words. Only a $text query runs here: the search
+    collection is filled by index_search.py, and messages it has not indexed yet are not found.
+    """
+    terms = " ".join(query_terms(query))
+    if not terms:
+        return []
+    match = {"$text": {"$search": terms}}
+    if agent_name:
+        match["agentName"] = agent_name
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$logId",
+            "sessionId": {"$first": "$sessionId"},
+            "agentName": {"$first": "$agentName"},
+            "score": {"$sum": {"$meta": "textScore"}},
+            "messages": {"$push": {"index": "$index", "score": {"$meta": "textScore"}}},
+        }},
+        {"$sort": {"score": -1}},
+        {"$limit": limit},
+    ]
+    search_collection = collection.database.get_collection(SEARCH_COLLECTION)
+    try:
+        docs = list(search_collection.aggregate(pipeline))
+    except OperationFailure as exc:
+        # No text index yet: index_search.py has not run
+        logger.warning("Could not search %s: %s", search_collection.full_name, exc)
+        return []
+    return [
+        SearchHit(doc["sessionId"], doc.get("agentName"), doc["_id"], doc["score"],
+                  [message["index"] for message in sorted(doc["messages"], key=lambda m: (-m["score"], m["index"]))])
+        for doc in docs
+    ]
+
+
+class MongoLogStore:
+    """The Log collection behind the storage interface also implemented by file_store.FileLogStore."""
+
+    supports_live_tail = True
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def refresh(self):
+        pass
+
+    def load_session(self, session_id):
+        return load_session(self.collection, session_id)
+
+    def load_session_summary(self, session_id):
+        return load_session_summary(self.collection, session_id)
+
+    def load_message_page(self, session_id, roles, skip=0, limit=50, jump_to=None):
+        return load_message_page(self.collection, session_id, roles, skip=skip, limit=limit, jump_to=jump_to)
+
+    def list_sessions(self, agent_name=None, session_prefix=None, page_size=10, before_id=None, after_id=None):
+        return list_sessions(self.collection, agent_name=agent_name, session_prefix=session_prefix,
+                             page_size=page_size, before_id=before_id, after_id=after_id)
+
+    def list_agent_names(self):
+        return list_agent_names(self.collection)
+
+    def iter_session_documents(self, agent_name=None, session_ids=None, min_id=None, max_id=None):
+        return iter_session_documents(self.collection, agent_name=agent_name, session_ids=session_ids,
+                                      min_id=min_id, max_id=max_id)
+
+    def count_session_errors(self, session_ids):
+        return count_session_errors(self.collection, session_ids)
+
+    def session_sizes(self, session_ids):
+        return session_sizes(self.collection, session_ids)
+
+    def load_rollups(self, agent_name=None):
+        return load_rollups(self.collection, agent_name)
+
+    def search(self, query, agent_name=None, limit=SEARCH_LIMIT):
+        return search_sessions(self.collection, query, agent_name, limit)
@@ -0,0 +1,101 @@
+"""Synthetic Log documents shaped like sampleLog.json, for benchmarks.
+
+generate_session() writes OpenAI style sessions (``tool_calls`` on the assistant
+message, one ``sl_role: TOOL`` message per result, as in sampleLog.json) or Bedrock
+style ones (``toolUse``/``toolResult`` content blocks). The output is deterministic
+for a given seed.
+"""
+import json
+import random
+
+# Tool names and their weights, after the storyteller agent in sampleLog.json
+TOOLS = {
+    "UpdateWorkingMemory": 6,
+    "CreateChapterContent": 3,
+    "AnalyzeStoryPrompt": 1,
+    "GenerateInitialContext": 1,
+    "PlanStoryStructure": 1,
+}
+STYLES = ("openai", "bedrock")
+
+
+def _payload(rng, size):
+    words = ("space", "pirate", "robot", "dog", "chapter", "story", "memory", "update", "friendship", "planet")
+    text = []
+    length = 0
+    while length < size:
+        word = rng.choice(words)
+        text.append(word)
+        length += len(word) + 1
+    return " ".join(text)[:size]
+
+
+def generate_session(message_count=1000, turns=1, parallel_calls=3, error_ratio=0.02, payload_size=200,
+                     style="openai", seed=0, session_id=None):
+    """A Log document with about ``message_count`` messages.
+
+    The session has ``turns`` user turns; each assistant step makes 1 to ``parallel_calls``
+    tool calls, and each tool result fails with probability ``error_ratio``. Tool
+    arguments and results carry ``payload_size`` characters of text.
+    """
+    if style not in STYLES:
+        raise ValueError(f"Unknown style {style!r}, expected one of {STYLES}")
+    rng = random.Random(seed)
+    names = list(TOOLS)
+    weights = list(TOOLS.values())
+    messages = [{"content": "You are a children's storyteller agent. " + _payload(rng, payload_size),
+                 "sl_role": "SYSTEM"}]
+    turns = max(turns, 1)
+    call_number = 0
+
+    for turn in range(turns):
+        # Each turn fills its share of the messages, ending with a plain assistant answer
+        turn_end = 1 + (turn + 1) * (message_count - 1) // turns
+        messages.append({"content": f"<userPrompt>{_payload(rng, payload_size)}</userPrompt>", "sl_role": "USER"})
+        while len(messages) < turn_end - 1:
+            calls = []
+            for _ in range(rng.randint(1, parallel_calls)):
+                call_number += 1
+                calls.append((f"call_{seed}_{call_number}", rng.choices(names, weights)[0],
+                               json.dumps({"sessionId": session_id or f"synthetic-{seed}",
+                                           "content": _payload(rng, payload_size)})))
+            failed = [rng.random() < error_ratio for _ in calls]
+            if style == "openai":
+                messages.extend(_openai_step(rng, calls, failed, payload_size))
+            else:
+                messages.extend(_bedrock_step(rng, calls, failed, payload_size))
+        messages.append({"content": _payload(rng, payload_size), "role": "assistant"})
+
+    return {
+        "sessionId": session_id or f"synthetic-{style}-{seed}",
+        "agentName": "synthetic",
+        "messages": messages[:max(message_count, 1)],
+    }
+
+
+def _openai_step(rng, calls, failed, payload_size):
+    messages = [{
+        "content": "None",
+        "refusal": None,
+        "role": "assistant",
+        "tool_calls": [{"function": {"arguments": arguments, "name": name}, "id": call_id, "type": "function"}
+                       for call_id, name, arguments in calls],
+    }]
+    for (call_id, name, _), call_failed in zip(calls, failed):
+        messages.append({"content": _payload(rng, payload_size), "function_id": call_id, "sl_role": "TOOL"})
+        if call_failed:
+            messages.append({"content": f"{name} failed: {_payload(rng, 40)}", "sl_role": "ERROR"})
+    return messages
+
+
+def _bedrock_step(rng, calls, failed, payload_size):
+    content = [{"text": _payload(rng, 40)}]
+    content.extend({"toolUse": {"toolUseId": call_id, "name": name, "input": json.loads(arguments)}}
+                   for call_id, name, arguments in calls)
+    results = []
+    for (call_id, _, _), call_failed in zip(calls, failed):
+        result = {"toolUseId": call_id, "content": [{"text": _payload(rng, payload_size)}]}
+        if call_failed:
+            result["error"] = _payload(rng, 40)
+        results.append({"toolResult": result})
+    return [{"role": "assistant", "content": content}, {"role": "user", "content": results}]
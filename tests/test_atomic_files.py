@@ -0,0 +1,62 @@
+"""atomic_write() and the exports written with it."""
+import os
+import threading
+
+import pytest
+
+import perf
+from atomic_files import atomic_write
+
+
+class Failed(Exception):
+    pass
+
+
+def test_failed_write_leaves_the_file_alone(tmp_path):
+    path = tmp_path / "index.json"
+    path.write_text("old")
+    with pytest.raises(Failed):
+        with atomic_write(path) as f:
+            f.write("half")
+            raise Failed()
+    assert os.listdir(tmp_path) == ["index.json"]
+    assert path.read_text() == "old"
+
+
+def test_partial_write_kept_when_asked(tmp_path):
+    path = tmp_path / "manifest.jsonl"
+    with pytest.raises(Failed):
+        with atomic_write(path, keep_partial=True) as f:
+            f.write("line\n")
+            raise Failed()
+    assert os.listdir(tmp_path) == ["manifest.jsonl"]
+    assert path.read_text() == "line\n"
+
+
+def test_concurrent_prometheus_writes(tmp_path):
+    path = str(tmp_path / "agent_hub.prom")
+    stats = perf.SpanStats()
+    timings = perf.RerunTimings()
+    with timings.span("graph"):
+        pass
+    timings.seconds = timings.elapsed()
+    stats.add(timings, slow=False)
+    errors = []
+
+    def write():
+        try:
+            for _ in range(50):
+                perf.write_prometheus(path, stats)
+        except OSError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=write) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert os.listdir(tmp_path) == ["agent_hub.prom"]
+    text = open(path, encoding="utf-8").read()
+    assert 'agent_hub_span_seconds_count{span="graph"} 1' in text
+    assert "bytes" not in text
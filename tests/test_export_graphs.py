@@ -0,0 +1,63 @@
+"""export_graphs.run() on synthetic sessions, DOT output only so no Graphviz binary is needed."""
+import json
+import os
+
+import pytest
+from bson import ObjectId
+
+from export_graphs import MANIFEST_NAME, read_manifest, run
+from synthetic_sessions import generate_session
+
+
+class ListStore:
+    """The iter_session_documents() part of a log store, over a list of documents."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def iter_session_documents(self, **selection):
+        return iter(self.docs)
+
+
+def _docs():
+    docs = [dict(generate_session(20, session_id=f"s{i}", seed=i), _id=ObjectId()) for i in range(3)]
+    docs.insert(1, {"_id": ObjectId(), "sessionId": "broken", "agentName": "synthetic",
+                    "messages": [{"role": "assistant", "tool_calls": ["x"]}]})
+    return docs
+
+
+def test_failed_session_does_not_stop_the_run(tmp_path):
+    docs = _docs()
+    out_dir = str(tmp_path)
+    assert run(ListStore(docs), out_dir, {}, ["dot"], "auto", 100, 1.0, workers=2) == (3, 0, 1)
+
+    assert sorted(os.listdir(out_dir)) == [MANIFEST_NAME, "s0.dot", "s1.dot", "s2.dot"]
+    entries = read_manifest(os.path.join(out_dir, MANIFEST_NAME))
+    assert len(entries) == 4
+    broken = entries[str(docs[1]["_id"])]
+    assert broken["sessionId"] == "broken" and broken["files"] == [] and "AttributeError" in broken["error"]
+
+    # Exported sessions are skipped next time, the failed one is tried again
+    assert run(ListStore(docs), out_dir, {}, ["dot"], "auto", 100, 1.0, workers=2) == (0, 3, 1)
+
+
+def test_interrupted_run_keeps_the_manifest(tmp_path):
+    docs = _docs()
+    out_dir = str(tmp_path)
+    run(ListStore(docs[:1]), out_dir, {}, ["dot"], "auto", 100, 1.0, workers=1)
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupted_documents(**selection):
+        yield from docs[2:]
+        raise Interrupted()
+
+    store = ListStore(docs)
+    store.iter_session_documents = interrupted_documents
+    with pytest.raises(Interrupted):
+        run(store, out_dir, {}, ["dot"], "auto", 100, 1.0, workers=1)
+
+    assert sorted(os.listdir(out_dir)) == [MANIFEST_NAME, "s0.dot", "s1.dot", "s2.dot"]
+    with open(os.path.join(out_dir, MANIFEST_NAME), encoding="utf-8") as f:
+        assert sorted(json.loads(line)["sessionId"] for line in f) == ["s0", "s1", "s2"]
@@ -0,0 +1,58 @@
+"""FileLogStore on small JSONL dumps."""
+import json
+import os
+
+import file_store
+from file_store import INDEX_SUFFIX, FileLogStore
+from synthetic_sessions import generate_session
+
+
+def _write_dump(path, docs):
+    with open(path, "w", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc) + "\n")
+
+
+def test_malformed_session_is_skipped(tmp_path):
+    good = generate_session(30, session_id="good")
+    bad = {"sessionId": "bad", "agentName": "synthetic",
+           "messages": [{"role": "assistant", "tool_calls": ["x"]}]}
+    _write_dump(tmp_path / "dump.jsonl", [bad, good])
+
+    store = FileLogStore(str(tmp_path))
+    assert [session["sessionId"] for session in store.list_sessions().sessions] == ["good"]
+    assert store.load_session("bad") is None
+    assert store.load_session("good").message_count == 30
+
+
+def test_index_is_written_whole(tmp_path, monkeypatch):
+    _write_dump(tmp_path / "dump.jsonl", [generate_session(10, session_id=f"s{i}", seed=i) for i in range(3)])
+    FileLogStore(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted(["dump.jsonl", INDEX_SUFFIX])
+    with open(tmp_path / INDEX_SUFFIX, encoding="utf-8") as f:
+        index = json.load(f)
+    assert len(index["files"]["dump.jsonl"]["entries"]) == 3
+
+    # A reopened store reads the index instead of the dump
+    monkeypatch.setattr(file_store, "index_file", None)
+    store = FileLogStore(str(tmp_path))
+    assert len(store.list_sessions().sessions) == 3
+
+
+def test_sessions_without_id_page_through(tmp_path):
+    _write_dump(tmp_path / "dump.jsonl", [generate_session(5, session_id=f"s{i}", seed=i) for i in range(5)])
+    store = FileLogStore(str(tmp_path))
+    seen = []
+    page = store.list_sessions(page_size=2)
+    while True:
+        assert all(session["_id"] is not None for session in page.sessions)
+        seen += [session["sessionId"] for session in page.sessions]
+        if not page.has_older:
+            break
+        page = store.list_sessions(page_size=2, before_id=page.last_id)
+    # Newest first, which is file order reversed
+    assert seen == ["s4", "s3", "s2", "s1", "s0"]
+
+    back = store.list_sessions(page_size=2, after_id=page.first_id)
+    assert [session["sessionId"] for session in back.sessions] == ["s2", "s1"]
+    assert store.load_session("s3").doc_id == store.list_sessions(page_size=2).sessions[1]["_id"]
@@ -0,0 +1,72 @@
+"""build_summary_graph(): the node budget, folding of repeated tool cycles and expanding folds."""
+import re
+
+from flow_graph import build_summary_graph
+from message_model import normalize_messages
+
+NODE = re.compile(r"^\s*(\w+) \[", re.MULTILINE)
+
+
+def _nodes(summary):
+    return set(NODE.findall(summary.graph.source))
+
+
+def _tool_cycle(turn, steps):
+    """A user turn followed by ``steps`` ReadFile calls and their results."""
+    messages = [{"role": "user", "content": f"turn {turn}"}]
+    for step in range(steps):
+        call_id = f"{turn}-{step}"
+        messages.append({"role": "assistant", "tool_calls": [{"id": call_id, "function": {"name": "ReadFile"}}]})
+        messages.append({"role": "tool", "tool_call_id": call_id, "content": "ok"})
+    messages.append({"role": "assistant", "content": "done"})
+    return messages
+
+
+def _session(turns, steps=3):
+    return normalize_messages([message for turn in range(turns) for message in _tool_cycle(turn, steps)])
+
+
+def test_repeated_tool_calls_are_folded():
+    summary = build_summary_graph(_session(1, steps=6))
+    folds = [node_id for node_id in summary.folds if node_id.startswith("fold_")]
+    assert len(folds) == 1
+    assert "×6" in summary.folds[folds[0]]
+    assert folds[0] in _nodes(summary)
+
+    # An expanded fold draws every step and can be folded again
+    expanded = build_summary_graph(_session(1, steps=6), expanded=folds)
+    assert folds[0] not in _nodes(expanded) and folds[0] in expanded.folds
+    assert len(_nodes(expanded)) > len(_nodes(summary))
+
+
+def test_many_turns_fit_the_budget():
+    messages = _session(2000)
+    summary = build_summary_graph(messages, node_budget=150)
+    assert len(_nodes(summary)) <= 155
+    assert len(summary.folds) <= 150
+    first = next(iter(summary.folds))
+    assert first.startswith("turns_1_") and summary.folds[first].startswith("Turns 1–")
+    # Only the oldest turns are merged, the most recent collapsed ones stay single
+    assert "turn_1999" in summary.folds
+
+
+def test_expanding_a_range_opens_smaller_ranges():
+    messages = _session(2000)
+    summary = build_summary_graph(messages, node_budget=150)
+    first = next(iter(summary.folds))
+    expanded = build_summary_graph(messages, node_budget=150, expanded=[first])
+    nodes = _nodes(expanded)
+    assert first not in nodes and first in expanded.folds
+    pieces = [node_id for node_id in expanded.folds if node_id.startswith("turns_") and node_id != first]
+    assert 2 <= len(pieces) <= 10 and set(pieces) <= nodes
+    assert len(nodes) <= len(_nodes(summary)) + 10
+
+
+def test_expanded_turn_is_drawn_in_full():
+    messages = _session(20)
+    summary = build_summary_graph(messages, node_budget=30)
+    assert "turn_2" in summary.folds and "turn_2" in _nodes(summary)
+
+    expanded = build_summary_graph(messages, node_budget=30, expanded=["turn_2"])
+    assert "turn_2" not in _nodes(expanded) and "turn_2" in expanded.folds
+    assert "cluster_turn_2" in expanded.graph.source
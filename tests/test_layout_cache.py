@@ -0,0 +1,79 @@
+"""is_finished() and the disk layout cache."""
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+from layout_cache import SETTLE_TIME, DiskLayoutCache, GrowthTracker, Layout, is_finished
+from session_store import Session
+from synthetic_sessions import generate_session
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _session(doc_id, message_count):
+    doc = generate_session(message_count)
+    return Session.from_document(dict(doc, _id=doc_id, messages=doc["messages"][:message_count]))
+
+
+def _old_id():
+    return ObjectId.from_datetime(datetime.now(timezone.utc) - timedelta(days=1))
+
+
+def test_old_session_is_finished_until_seen_growing():
+    clock = FakeClock()
+    tracker = GrowthTracker(clock=clock)
+    doc_id = _old_id()
+    assert is_finished(_session(doc_id, 20), tracker)
+    assert is_finished(_session(doc_id, 20), tracker)
+
+    # A long-running session: laid out in the browser while it keeps growing
+    clock.now += 60
+    assert not is_finished(_session(doc_id, 30), tracker)
+    clock.now += 60
+    assert not is_finished(_session(doc_id, 40), tracker)
+    clock.now += 60
+    assert not is_finished(_session(doc_id, 40), tracker)
+    clock.now += SETTLE_TIME.total_seconds()
+    assert is_finished(_session(doc_id, 40), tracker)
+
+
+def test_recent_and_exported_sessions():
+    tracker = GrowthTracker(clock=FakeClock())
+    assert not is_finished(_session(ObjectId(), 20), tracker)
+    assert is_finished(_session(None, 20), tracker)
+    assert is_finished(_session("dump.jsonl@000000000000000", 20), tracker)
+
+
+def test_tracker_forgets_the_oldest_sessions():
+    tracker = GrowthTracker(max_sessions=2, clock=FakeClock())
+    for doc_id in range(3):
+        tracker.settled(doc_id, "a")
+    # Session 0 was forgotten, so its change goes unnoticed; session 2's does not
+    assert tracker.settled(0, "b") and not tracker.settled(2, "b")
+
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskLayoutCache(str(tmp_path))
+    layout = Layout("<svg/>", {"fold_3": "ReadFile ×4"})
+    cache.put("abcdef", layout)
+    assert cache.get("abcdef") == layout
+    assert cache.get("missing") is None
+
+
+def test_failed_put_leaves_no_temporary_file(tmp_path, monkeypatch):
+    def replace(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", replace)
+    cache = DiskLayoutCache(str(tmp_path))
+    cache.put("abcdef", Layout("<svg/>"))
+    assert os.listdir(tmp_path / "ab") == []
+    monkeypatch.undo()
+    assert cache.get("abcdef") is None
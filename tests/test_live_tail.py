@@ -0,0 +1,127 @@
+"""SessionTail against mongomock, polling instead of watching a change stream."""
+import pytest
+
+import live_tail
+from live_tail import STREAM_MAX_AWAIT_MS, SessionTail
+from message_model import normalize_messages
+from synthetic_sessions import generate_session
+
+mongomock = pytest.importorskip("mongomock")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().get_database("agent_hub").get_collection("Log")
+
+
+def _append(collection, session_id, messages):
+    collection.update_one({"sessionId": session_id}, {"$push": {"messages": {"$each": messages}}})
+
+
+def _summary(messages):
+    return [(message.index, message.kind, message.response_ids) for message in messages]
+
+
+def test_poll_appends_new_messages(collection):
+    doc = generate_session(60, error_ratio=0.2)
+    collection.insert_one(dict(doc, messages=doc["messages"][:20]))
+    clock = FakeClock()
+    tail = SessionTail(collection, doc["sessionId"], interval=2.0, use_change_stream=False, clock=clock)
+    assert not tail.uses_change_stream
+    assert len(tail.messages) == 20
+
+    _append(collection, doc["sessionId"], doc["messages"][20:])
+    assert tail.poll() == 0  # the interval has not passed yet
+    clock.now = 2.0
+    assert tail.poll() == 40
+
+    expected = normalize_messages(doc["messages"])
+    assert _summary(tail.messages) == _summary(expected)
+    assert tail.max_parallel_calls == max(len(message.tool_calls) for message in expected)
+    # Responses appended later are linked to calls fetched earlier
+    for message in expected:
+        for call_id in message.response_ids:
+            assert tail.session_index.link(call_id).response_index is not None
+    assert tail.graph.source.count("->") > 0
+
+
+def test_idle_polls_back_off(collection):
+    doc = generate_session(10)
+    collection.insert_one(doc)
+    clock = FakeClock()
+    tail = SessionTail(collection, doc["sessionId"], interval=2.0, max_interval=6.0, use_change_stream=False,
+                       clock=clock)
+    intervals = []
+    for _ in range(4):
+        clock.now += tail.current_interval
+        assert tail.poll() == 0
+        intervals.append(tail.current_interval)
+    assert intervals == [4.0, 6.0, 6.0, 6.0]
+
+    _append(collection, doc["sessionId"], [{"role": "user", "content": "more"}])
+    clock.now += tail.current_interval
+    assert tail.poll() == 1
+    assert tail.current_interval == 2.0
+
+
+def test_catches_up_in_batches(collection, monkeypatch):
+    monkeypatch.setattr(live_tail, "TAIL_BATCH_SIZE", 7)
+    doc = generate_session(50)
+    collection.insert_one(doc)
+    tail = SessionTail(collection, doc["sessionId"], use_change_stream=False, clock=FakeClock())
+    assert _summary(tail.messages) == _summary(normalize_messages(doc["messages"]))
+
+
+def test_missing_session(collection):
+    tail = SessionTail(collection, "no-such-session", clock=FakeClock())
+    assert tail.messages == [] and tail.doc_id is None and not tail.uses_change_stream
+
+
+def test_change_stream_waits_briefly(collection, monkeypatch):
+    doc = generate_session(10)
+    collection.insert_one(doc)
+    opened = {}
+
+    class Stream:
+        def try_next(self):
+            return None
+
+        def close(self):
+            pass
+
+    def watch(pipeline, **kwargs):
+        opened.update(kwargs)
+        return Stream()
+
+    monkeypatch.setattr(collection, "watch", watch)
+    tail = SessionTail(collection, doc["sessionId"], clock=FakeClock())
+    assert tail.uses_change_stream
+    assert opened["max_await_time_ms"] == STREAM_MAX_AWAIT_MS
+    assert tail.poll() == 0
+
+
+def test_append_while_opening_the_stream_is_read(collection, monkeypatch):
+    doc = generate_session(30)
+    collection.insert_one(dict(doc, messages=doc["messages"][:10]))
+
+    class Stream:
+        def try_next(self):
+            return None
+
+    def watch(pipeline, **kwargs):
+        # The last messages of the run arrive just before the stream starts reporting changes
+        _append(collection, doc["sessionId"], doc["messages"][10:])
+        return Stream()
+
+    monkeypatch.setattr(collection, "watch", watch)
+    tail = SessionTail(collection, doc["sessionId"], clock=FakeClock())
+    assert tail.uses_change_stream
+    assert _summary(tail.messages) == _summary(normalize_messages(doc["messages"]))
@@ -0,0 +1,112 @@
+"""Prefetcher scheduling and cancellation, and the GraphCache builds it shares with the dashboard."""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from flow_graph import GraphCache
+from prefetch import Prefetcher
+
+TIMEOUT = 5
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(1) as executor:
+        yield executor
+
+
+def test_byte_cap_skips_large_and_unknown_sessions(executor):
+    done = []
+    prefetcher = Prefetcher(executor, max_bytes=100)
+    tasks = [(size, lambda cancelled, name=name: done.append(name))
+             for size, name in ((60, "a"), (None, "unknown"), (50, "too large"), (40, "b"))]
+    assert prefetcher.replace("list", tasks) == 2
+    assert prefetcher.replace("list", tasks) == 0  # the same list again
+    executor.shutdown(wait=True)
+    assert done == ["a", "b"]
+
+
+def test_new_list_cancels_the_old_one(executor):
+    started = threading.Event()
+    release = threading.Event()
+    seen = {}
+
+    def running(cancelled):
+        started.set()
+        release.wait(TIMEOUT)
+        seen["running"] = cancelled()
+
+    def queued(cancelled):
+        seen["queued"] = True
+
+    def new(cancelled):
+        seen["new"] = cancelled()
+
+    prefetcher = Prefetcher(executor, max_bytes=100)
+    prefetcher.replace("old", [(1, running), (1, queued)])
+    assert started.wait(TIMEOUT)
+    prefetcher.replace("new", [(1, new)])
+    release.set()
+    executor.shutdown(wait=True)
+    # The queued task never ran; the running one was told to stop
+    assert seen == {"running": True, "new": False}
+    assert prefetcher.pending == 0
+
+
+def test_graph_is_built_once_while_others_wait():
+    cache = GraphCache(max_bytes=1000)
+    building = threading.Event()
+    release = threading.Event()
+    builds = []
+
+    def build():
+        builds.append(threading.current_thread().name)
+        building.set()
+        release.wait(TIMEOUT)
+        return "graph"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get_or_build("key", build, sizer=len)))
+    first.start()
+    assert building.wait(TIMEOUT)
+    waiters = [threading.Thread(target=lambda: results.append(cache.get_or_build("key", build, sizer=len)))
+               for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    release.set()
+    for thread in [first] + waiters:
+        thread.join(TIMEOUT)
+    assert results == ["graph"] * 4
+    assert len(builds) == 1
+
+
+def test_failed_build_lets_a_waiter_build():
+    cache = GraphCache(max_bytes=1000)
+    building = threading.Event()
+    release = threading.Event()
+
+    def failing():
+        building.set()
+        release.wait(TIMEOUT)
+        raise RuntimeError("boom")
+
+    errors = []
+
+    def first():
+        try:
+            cache.get_or_build("key", failing, sizer=len)
+        except RuntimeError as exc:
+            errors.append(exc)
+
+    thread = threading.Thread(target=first)
+    thread.start()
+    assert building.wait(TIMEOUT)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.get_or_build("key", lambda: "graph", sizer=len)))
+    waiter.start()
+    release.set()
+    thread.join(TIMEOUT)
+    waiter.join(TIMEOUT)
+    assert len(errors) == 1 and results == ["graph"]
+    assert cache.get("key") == "graph"
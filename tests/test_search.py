@@ -0,0 +1,78 @@
+"""Message search: query terms, ranking of matching messages, and the MongoDB search collection."""
+import shutil
+from pathlib import Path
+
+from bson import ObjectId
+
+from file_store import FileLogStore
+from message_model import normalize_messages
+from search_index import SearchIndex, query_terms, search_indexes, tokenize
+from session_store import (
+    SEARCH_COLLECTION, SEARCH_MESSAGE_INDEX, ensure_search_indexes, search_sessions, update_search_index,
+)
+from synthetic_sessions import generate_session
+
+SAMPLE_LOG = Path(__file__).resolve().parent.parent / "sampleLog.json"
+
+
+def test_query_words_are_not_split():
+    assert tokenize("PlanStoryStructure") == ["planstorystructure", "plan", "story", "structure"]
+    assert query_terms("PlanStoryStructure stories the") == ["planstorystructure", "storie"]
+
+
+def test_best_matching_message_comes_first(tmp_path):
+    shutil.copy(SAMPLE_LOG, tmp_path)
+    store = FileLogStore(str(tmp_path))
+    hit, = store.search("PlanStoryStructure")
+    # The tool call, not the long system prompt that lists every tool
+    assert hit.message_ids[0] == 11
+    assert sorted(hit.message_ids) == [1, 11, 12]
+
+
+def test_message_ids_are_ordered_by_score():
+    index = SearchIndex()
+    index.add("empty", [])
+    index.add("session", normalize_messages([
+        {"role": "system", "content": "dragons " + "filler words " * 50},
+        {"role": "user", "content": "tell me about dragons"},
+        {"role": "assistant", "content": "dragons dragons"},
+    ]))
+    (_, document, _, message_ids), = search_indexes([index], "dragon")
+    assert index.documents[document] == "session"
+    assert message_ids == [3, 2, 1]
+
+
+def test_mongo_search_index_is_unique_and_ranked(mongo_database):
+    collection = mongo_database.get_collection("Log")
+    docs = [generate_session(40, style=style, seed=seed) for seed, style in enumerate(("openai", "bedrock"))]
+    collection.insert_many(docs)
+    ensure_search_indexes(collection)
+    assert update_search_index(collection) == 2
+    # A second indexer racing the first, or a rerun, must not store messages twice
+    mongo_database.get_collection("LogSearchState").delete_many({})
+    update_search_index(collection)
+    search_collection = mongo_database.get_collection(SEARCH_COLLECTION)
+    indexed = sum(len(doc["messages"]) for doc in docs)
+    assert search_collection.count_documents({}) == indexed
+
+    # The same messages as the in-memory index finds, each once
+    hits = search_sessions(collection, "PlanStoryStructure")
+    assert hits
+    for hit in hits:
+        doc = next(doc for doc in docs if doc["sessionId"] == hit.session_id)
+        index = SearchIndex()
+        index.add(0, normalize_messages(doc["messages"]))
+        (_, _, _, expected), = search_indexes([index], "PlanStoryStructure")
+        assert sorted(hit.message_ids) == sorted(expected)
+
+
+def test_mongo_duplicates_removed_when_index_made_unique(mongo_database):
+    collection = mongo_database.get_collection("Log")
+    search_collection = mongo_database.get_collection(SEARCH_COLLECTION)
+    # The non-unique index of earlier versions, with a message stored twice
+    search_collection.create_index(SEARCH_MESSAGE_INDEX)
+    log_id = ObjectId()
+    search_collection.insert_many([{"logId": log_id, "index": 1, "terms": "dragon"} for _ in range(2)])
+    ensure_search_indexes(collection)
+    assert search_collection.count_documents({}) == 1
+    assert any(index.get("unique") for index in search_collection.index_information().values())
@@ -0,0 +1,127 @@
+"""The MongoDB pipelines of session_store against the in-memory path they mirror.
+
+load_message_page(), count_session_errors() and the rollup pipeline classify messages
+inside MongoDB; paginate_messages(), the file store and the live tail use
+normalize_message() instead. Both must agree on every session.
+"""
+import pytest
+
+from analytics import session_rollup
+from message_model import FILTER_ROLES, TOOL_RESPONSE, SessionIndex, normalize_messages
+from session_store import (
+    _kind_expr, _rollup_pipeline, count_session_errors, load_message_page, load_rollups, paginate_messages,
+    update_rollups,
+)
+from synthetic_sessions import STYLES, generate_session
+
+ROLE_SETS = [FILTER_ROLES, ["tool"], ["error"], ["assistant"], ["user", "system"], ["other"]]
+
+# Shapes where MongoDB and Python truthiness or the id fallbacks could disagree
+EDGE_SESSION = {
+    "sessionId": "edge-cases",
+    "agentName": "edge",
+    "messages": [
+        {"sl_role": "", "role": "system", "content": "You are a test."},
+        {"role": "user", "content": "Go"},
+        "not a message",
+        None,
+        {"role": "assistant", "tool_calls": [{"id": "a", "function": {"name": "First"}}, {"id": "b", "function": None},
+                                             {"function": {"name": None}}]},
+        {"role": "assistant", "tool_calls": [], "content": [{"toolUse": {"toolUseId": "c", "name": "Third"}},
+                                                            {"toolUse": {"toolUseId": "d"}}]},
+        {"role": "assistant", "content": [{"toolUse": ""}, {"toolUse": {}}, {"text": "thinking"}]},
+        {"role": "assistant", "tool_calls": None, "content": "plain answer"},
+        {"role": "tool", "function_id": "", "tool_call_id": "a", "content": "first done"},
+        {"role": "tool", "function_id": "b", "content": [{"toolResult": {"toolUseId": "c", "error": ""}}]},
+        {"role": "user", "content": [{"toolResult": {"toolUseId": "d", "error": {}}}, {"toolResult": ""}]},
+        {"role": "user", "content": [{"toolResult": {"content": []}}]},
+        {"role": "user", "content": [{"toolResult": {"toolUseId": "b", "error": "timeout"}}]},
+        {"sl_role": "TOOL", "content": "no call id"},
+        {"sl_role": "ERROR", "content": "boom"},
+        {"role": "Error"},
+        {"role": "observer", "content": "other"},
+    ],
+}
+
+
+def _sessions():
+    docs = [generate_session(300, turns=2, error_ratio=0.2, style=style, seed=seed)
+            for seed, style in enumerate(STYLES)]
+    return docs + [dict(EDGE_SESSION, messages=list(EDGE_SESSION["messages"]))]
+
+
+@pytest.fixture
+def log_collection(mongo_database):
+    collection = mongo_database.get_collection("Log")
+    collection.insert_many(_sessions())
+    return collection
+
+
+def _page_record(page):
+    """What the history view shows of a page: message indexes and the tools each response answers."""
+    return {
+        "total": page.total,
+        "skip": page.skip,
+        "position": page.position,
+        "messages": [
+            (message.index, message.kind, message.is_error,
+             [(link.call_id, link.name, link.call_index) for link in page.session_index.response_links(message)]
+             if message.kind == TOOL_RESPONSE else [])
+            for message in page.messages
+        ],
+    }
+
+
+def test_kinds_match_normalize_message(log_collection):
+    for doc in log_collection.find():
+        pipeline = [
+            {"$match": {"_id": doc["_id"]}},
+            {"$project": {"kinds": {"$map": {"input": "$messages", "as": "m", "in": _kind_expr("$$m")}}}},
+        ]
+        kinds = next(log_collection.aggregate(pipeline))["kinds"]
+        messages = {message.index: message for message in normalize_messages(doc["messages"])}
+        expected = [
+            {"kind": messages[i].kind, "isError": messages[i].is_error} if i in messages
+            else {"kind": "skip", "isError": False}
+            for i in range(1, len(doc["messages"]) + 1)
+        ]
+        assert kinds == expected, doc["sessionId"]
+
+
+@pytest.mark.parametrize("roles", ROLE_SETS)
+def test_message_pages_match_paginate_messages(log_collection, roles):
+    for doc in log_collection.find():
+        messages = normalize_messages(doc["messages"])
+        session_index = SessionIndex(messages)
+        for options in ({"limit": 10000}, {"skip": 7, "limit": 7}, {"limit": 7, "jump_to": len(doc["messages"]) - 2}):
+            page = load_message_page(log_collection, doc["sessionId"], roles, **options)
+            expected = paginate_messages(messages, session_index, roles, **options)
+            assert _page_record(page) == _page_record(expected), (doc["sessionId"], options)
+
+
+def test_error_counts_match(log_collection):
+    docs = list(log_collection.find())
+    counts = count_session_errors(log_collection, [doc["sessionId"] for doc in docs])
+    for doc in docs:
+        assert counts[doc["sessionId"]] == sum(message.is_error for message in normalize_messages(doc["messages"]))
+
+
+def _sorted_counts(rollup):
+    for key in ("toolCalls", "errorTools"):
+        rollup[key] = sorted(rollup[key], key=lambda entry: str(entry["name"]))
+    return rollup
+
+
+def test_rollup_pipeline_matches_session_rollup(log_collection):
+    for doc in log_collection.find():
+        rollup = next(log_collection.aggregate(_rollup_pipeline({"_id": doc["_id"]})))
+        assert _sorted_counts(rollup) == _sorted_counts(session_rollup(doc)), doc["sessionId"]
+
+
+def test_dashboard_reads_the_rollups_written_by_the_job(log_collection):
+    assert load_rollups(log_collection) == []
+    newest = update_rollups(log_collection)
+    assert newest == log_collection.find_one(sort=[("_id", -1)])["_id"]
+    rollups = {rollup["_id"]: rollup for rollup in load_rollups(log_collection)}
+    for doc in log_collection.find():
+        assert _sorted_counts(rollups[doc["_id"]]) == _sorted_counts(session_rollup(doc)), doc["sessionId"]